@@ -0,0 +1,77 @@
+import random
+
+import vidChew3
+
+audioCodecs = ["ac3", "eac3", "dts", "aac", "truehd", "flac", "opus"]
+languages = ["eng", "jpn", "fre", None]
+
+### Random ffprobe output: a video track (usually), some audio & subtitle tracks with gaps in their tags
+
+def random_probe(rng):
+	
+	streams = []
+	if rng.random() < 0.95:
+		streams.append({"codec_type": "video", "codec_name": "h264", "width": rng.choice([1280, 1920, 3840]), "height": rng.choice([720, 1080, 2160]), "display_aspect_ratio": rng.choice(["16:9", "4:3"])})
+	for i in range(rng.randint(0, 5)):
+		stream = {"codec_type": "audio", "codec_name": rng.choice(audioCodecs)}
+		language = rng.choice(languages)
+		if language is not None: stream["tags"] = {"language": language}
+		channels = rng.choice([None, 1, 2, 2, 6, 6, 8])
+		if channels is not None: stream["channels"] = channels
+		if rng.random() < 0.6: stream["bit_rate"] = str(rng.choice([96000, 192000, 448000, 640000, 1536000]))
+		if stream["codec_name"] == "dts" and rng.random() < 0.5: stream["profile"] = "DTS-HD MA"
+		streams.append(stream)
+	for i in range(rng.randint(0, 3)):
+		stream = {"codec_type": "subtitle", "codec_name": rng.choice(["subrip", "ass", "hdmv_pgs_subtitle", "dvd_subtitle"])}
+		language = rng.choice(languages)
+		if language is not None: stream["tags"] = {"language": language}
+		streams.append(stream)
+	rng.shuffle(streams)
+	for index, stream in enumerate(streams):
+		stream["index"] = index
+	return {"format": {"duration": "1300.0", "bit_rate": "8000000"}, "streams": streams}
+
+### The original pass-by-pass deep search: each prefAudioFormats pass takes a track with more channels than
+### the best so far, a format pass only from targLang tracks in that codec, a blank pass from any track
+
+def deep_search_audio(probe, config):
+	
+	if len(probe.audio) == 1: return probe.audio[0].index
+	best = None
+	bestChannels = 0
+	for audioFormat in config.prefAudioFormats:
+		for stream in probe.audio:
+			if audioFormat != "" and not (stream.language == config.targLang and stream.codecName == audioFormat): continue
+			if stream.channels > bestChannels:
+				best = stream.index
+				bestChannels = stream.channels
+	return best
+
+### plan() picks the same audio & subtitle tracks as the original search for randomised probes
+
+def test_plan_matches_deep_search():
+	
+	rng = random.Random(1217)
+	for n in range(300):
+		prefAudioFormats = rng.sample(audioCodecs, rng.randint(0, 4))
+		if rng.random() < 0.7: prefAudioFormats.append("")
+		config = vidChew3.plan_config(prefAudioFormats=prefAudioFormats, targLang="eng", destDir="")
+		data = random_probe(rng)
+		probe = vidChew3.normalize_probe(data, "/media/input%s.mkv" % n, 1000000)
+		encodePlan = vidChew3.plan(probe, config)
+		
+		if not probe.video:
+			assert encodePlan.video is None
+			continue
+		
+		audioIndex = encodePlan.audio.index if encodePlan.audio is not None else None
+		assert audioIndex == deep_search_audio(probe, config), data
+		
+		subtitles = [stream.index for stream in probe.subtitle if stream.language == "eng"]
+		subtitleIndex = encodePlan.subtitle.index if encodePlan.subtitle is not None else None
+		assert subtitleIndex == (subtitles[0] if subtitles else None), data
+		
+		if encodePlan.audio is None:
+			assert encodePlan.audioMap == "" and encodePlan.audioOpt == "-an"
+		else:
+			assert encodePlan.audioMap == "-map 0:%s" % audioIndex
@@ -0,0 +1,52 @@
+import json, logging, os, threading, time
+
+import vidChew3
+
+### Point the queue functions at a queue folder in tmp_path, as a worker would after startup
+
+def setup_queue(tmp_path, monkeypatch):
+	
+	queueDir = str(tmp_path)
+	for state in ("pending", "running", "done", "failed"):
+		os.makedirs(os.path.join(queueDir, state))
+	monkeypatch.setattr(vidChew3, "queueDir", queueDir, raising=False)
+	monkeypatch.setattr(vidChew3, "queueStaleAfter", 300, raising=False)
+	monkeypatch.setattr(vidChew3, "workerId", "host-1", raising=False)
+	monkeypatch.setattr(vidChew3, "claimedPaths", set(), raising=False)
+	monkeypatch.setattr(vidChew3, "claimedLock", threading.Lock(), raising=False)
+	monkeypatch.setattr(vidChew3, "logLock", threading.Lock(), raising=False)
+	monkeypatch.setattr(vidChew3, "logger", logging.getLogger("vidChew3-test"), raising=False)
+	return queueDir
+
+### A job planned long before it's claimed must not look stale to another worker's sweep
+
+def test_claim_old_pending_job_during_stale_sweep(tmp_path, monkeypatch):
+	
+	queueDir = setup_queue(tmp_path, monkeypatch)
+	pendingPath = os.path.join(queueDir, "pending", "film.json")
+	with open(pendingPath, "w") as jobFile:
+		json.dump({"inputAbsPath": "/media/film.mkv", "logLines": []}, jobFile)
+	plannedAt = time.time() - 3600
+	os.utime(pendingPath, (plannedAt, plannedAt))
+	
+	sweepStop = threading.Event()
+	def sweep():
+		while not sweepStop.is_set():
+			vidChew3.queue_release_stale()
+	sweeper = threading.Thread(target=sweep)
+	sweeper.start()
+	try:
+		claimedPath, job = vidChew3.queue_claim()
+	finally:
+		sweepStop.set()
+		sweeper.join()
+	vidChew3.queue_release_stale()
+	
+	assert job["inputAbsPath"] == "/media/film.mkv"
+	assert os.path.isfile(claimedPath)
+	assert os.listdir(os.path.join(queueDir, "pending")) == []
+	assert vidChew3.claimedPaths == {claimedPath}
+	
+	vidChew3.queue_finish(claimedPath, "done")
+	assert os.listdir(os.path.join(queueDir, "done")) == ["film.json"]
+	assert vidChew3.claimedPaths == set()
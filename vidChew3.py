@@ -24,15 +24,16 @@ ver = "0412181217"
 ### Copyright (C) 2018 \m/rr - emarrarr@tuta.io
 ###
 ### Usage: vidChew3
-### Dependencies: python3, ffmpeg, ffprobe, gzip, coreutils
+### Dependencies: python3, ffmpeg, ffprobe, coreutils
 ###
 ### Recursive batch video reencode script with optional video downscaling and audio downmixing via ffmpeg,
 ### written in Python, intended for Linux.
 ###
 ### - vidChew3 works within the current directory and will recurse through subfolders.
 ###
-### - If a vidChew3conf.py file is placed in the current working directory, config variables will be read
-###   from it.  If not, config variables will be read from the Default Config section within the script below.
+### - If a vidChew3conf.py file is placed in the current working directory, config variables will be read from
+###   it.  Options it doesn't set (or no config file at all) fall back to the Default Config section within the
+###   script below, so config files from older versions keep working.
 ###
 ### - By default, vidChew3 outputs to the same folder the input resides in.  Output folder can be modified via
 ###   the destDir config variable.
@@ -82,6 +83,134 @@ ver = "0412181217"
 ### - Only alphanumeric characters, periods, dashes, and underscores are maintained in the destination
 ###   filename.
 ###
+### - If jobs is greater than 1, that many encodes run at once.  Each encode is limited to coresPerJob
+###   threads (if set), and each file's log block is written out whole rather than interleaved.
+###
+### - While encodes run, up to prefetchDepth upcoming files are probed and planned ahead of time using
+###   probeJobs ffprobe instances, so encoders never wait on metadata.
+###
+### - ffprobe results are cached in stateDbFile (in the input folder) keyed by device, inode, size and
+###   modification time.  Unchanged files are never probed twice.  Set probeCache to False to always probe.
+###
+### - If journal is enabled, each job's input, destination, plan hash and status (pending/running/done/failed)
+###   are recorded in stateDbFile.  A restarted run skips inputs already done with the same plan (as long as the
+###   output is still intact), removes partial outputs left by encodes that were cut short, and redoes them.
+###
+### - If segmentEncode is enabled, the video of inputs at least segmentMinDuration seconds long is split into
+###   segments (on chapter starts if chapters exist, otherwise every segmentLength seconds).  segmentJobs
+###   segments are encoded at once, then joined without reencoding and muxed with the selected audio/subtitle
+###   tracks and the input's chapters.
+###
+### - Several hosts sharing the same media can split the work.  Run one instance with runMode "coordinator" to
+###   plan jobs into queueDir, and any number with runMode "worker" (from any directory, with the share mounted
+###   at the same path) to encode them.  Workers claim jobs by atomic rename and heartbeat every queueHeartbeat
+###   seconds.  Jobs whose worker has gone quiet for queueStaleAfter seconds are put back in the queue.
+###
+### - ffmpeg is launched directly (no shell) and its -progress output is parsed.  Every progressInterval
+###   seconds, each running encode's progress, fps, speed, output size and ETA are logged, along with an ETA for
+###   the next jobs: the running encodes plus the planned jobs waiting on an encoder (up to prefetchDepth),
+###   based on their probed durations.  Files the walk has not probed yet are not counted, so set prefetchDepth
+###   to 0 for an ETA covering the whole batch.
+###
+### - Each finished or failed encode appends a JSON record to metricsFile (in the input folder).  Records hold
+###   wall time, ffmpeg's own user/sys CPU time and peak RSS, source/target resolution and codec, preset, CRF,
+###   input/output size and achieved fps.  The end of the run logs a summary of GB saved, CPU-hours spent and GB
+###   saved per CPU-hour.
+###
+### - With runMode "bench", vidChew3 generates synthetic clips from ffmpeg's lavfi sources (benchSources x
+###   benchSizes x benchDurations) in benchDir and encodes them with the exact ffmpeg cmd it would build for
+###   real media.  This runs for every combination of benchPresets, benchCrfs, benchThreads (coresPerJob) and
+###   benchJobs (simultaneous encodes).  fps, CPU efficiency and output size are logged and written to
+###   benchFile.
+###
+### - With runMode "plan", vidChew3 walks and plans without encoding, then reports files, hours and
+###   pixel-seconds per target resolution.  Using past encodes in metricsFile (matched by source codec, target
+###   resolution and preset), it predicts CPU-hours, wall-clock time at the configured jobs and output GB / GB
+###   saved.
+###
+### - If sampleEncode is enabled, sampleCount pieces of sampleLength seconds, spread through each input, are
+###   first encoded at once with the real settings.  Their size is extrapolated to the whole input.  Inputs
+###   predicted to save less than sampleMinSavings percent are skipped (sampleAction "skip", remembered in the
+###   journal) or encoded and flagged in the log ("flag").  Inputs shorter than twice the total sample length
+###   are never sampled.  Skips are remembered with their predicted savings, so turning sampleEncode off,
+###   switching to "flag" or lowering sampleMinSavings below them brings those inputs back.
+###
+### - If autoCrf is enabled, each input's CRF is binary searched within autoCrfRange on sampleCount video-only
+###   pieces of sampleLength seconds (encoded at once).  The lowest CRF whose samples stay within the
+###   autoCrfBitRates target for the output resolution class is used.  Results are kept in stateDbFile per
+###   folder, so sibling episodes reuse the tuned CRF instead of searching again.
+###
+### - The input folder is walked with os.scandir, and each folder is probed as soon as it has been read.  Hidden
+###   folders, excludeDirs, destDir and queueDir are never walked.  Only files with an extension in
+###   mediaExtensions and at least minInputSize MB are probed; their size and modification time come from the
+###   walk itself.
+###
+### - With runMode "watch", vidChew3 encodes the current directory and then keeps running, watching it (and new
+###   subfolders) with inotify.  Without inotify, it rescans every watchPoll seconds instead.  New or changed
+###   files are only encoded once their size and modification time have stayed the same for watchSettle seconds,
+###   so files still being copied in are left alone.
+###
+### - Logging runs through a QueueHandler/QueueListener, so jobs only queue their log lines and file/console
+###   writes happen on a separate thread.  If eventsFile is set, every log line and job event (planned, start,
+###   crf, sample, done, failed, skipped) is also written there as a JSON line, tagged with the input it belongs
+###   to.
+###
+### - ffmpeg logs (ffmpegLogs) are compressed as ffmpeg writes them: the report goes through a FIFO in a local
+###   temp folder into a gzip (or zstd, with Python 3.14+) file next to the input.  The uncompressed log is
+###   never written to disk.  Logs of failed encodes are renamed to *.ERROR.gz.
+###
+### - If scratchDir is set (e.g. a local NVMe or tmpfs folder), ffmpeg writes outputs, segments and samples
+###   there instead of the destination.  A finished output is fsynced and moved to its destination by
+###   offloadJobs background threads while the next encode runs.  Across filesystems it is copied to a
+###   .vidChew3-part file and renamed, so it only appears once complete.  Failed encodes never leave partial
+###   files at the destination.
+###
+### - If inputStaging is "copy", upcoming inputs are copied to scratchDir while the current encodes run, and
+###   ffmpeg reads the local copy.  With "fadvise", they are instead pre-read into the page cache with
+###   posix_fadvise(WILLNEED).  Only the next jobs the scheduler will hand out (one per encoder) are staged, one
+###   at a time and up to stagingBudget GB at once in both modes.  Larger inputs are read in place.  A copy is
+###   deleted, and its budget freed, as soon as its encode finishes.  Copies left in scratchDir by a crashed run
+###   are deleted at startup.  A job taken by an encoder before its staging started reads its input in place.
+###
+### - Planned jobs wait in a scheduler rather than a plain queue.  If jobsPerDevice is set, no device (st_dev of
+###   an input or output folder) has more than that many encodes at once.  Jobs on the least busy devices go
+###   first, so work is spread across disks.  The scheduler looks at the prefetchDepth jobs waiting, so raise
+###   prefetchDepth for wider interleaving (0 = no limit).
+###
+### - With schedulePolicy "savings", waiting jobs are encoded in order of expected bytes saved per CPU-second. 
+###   Output size and CPU time are predicted from past encodes in metricsFile (like runMode "plan").  Without
+###   history, output size is guessed from the source codec and the share of pixels kept, and CPU time from
+###   target pixel-seconds.  Set prefetchDepth to 0 to probe the whole library up front so the ordering covers
+###   every job.
+###
+### - With schedulePolicy "lpt", the longest expected encodes (by CPU time, from history or from probed duration
+###   and target resolution) are started first, so short episodes fill in around long films at the end of the
+###   batch instead of one film running alone.  Use prefetchDepth 0 so every job is known before the first one
+###   starts.  runMode "plan" reports the predicted wall-clock in walk order and with "lpt".
+###
+### - If resourceGovernor is enabled, every governorInterval seconds vidChew3 checks the 1 minute load average
+###   (minus the CPU its own ffmpegs used), MemAvailable from /proc/meminfo and memory/io pressure from
+###   /proc/pressure against governorMaxLoad, governorMinMemory and governorMaxPressure.  Under pressure one
+###   fewer encode may run at a time (down to 1).  Running ffmpegs are paused with SIGSTOP if memory runs short,
+###   pressure reaches twice the limit, or pressure stays high at a single encode.  Once everything is below 3/4
+###   of the limits, they get SIGCONT and encodes are added back one at a time up to jobs.  Encoders run at
+###   encodeNice and encodeIoClass/encodeIoLevel (through nice and ionice).
+###
+### - If encodeWindows is set (e.g. ["Mon-Fri 22:00-07:00", "Sat-Sun 00:00-24:00"]), encodes only start inside a
+###   window.  When a window closes, running ffmpegs are suspended in place with SIGSTOP (never killed, so no
+###   CPU time is lost) and continued with SIGCONT when the next window opens.  Windows past midnight belong to
+###   the day they start on.  Time spent suspended is left out of the wall times in metricsFile.
+###
+### - If streamPipeline is enabled, the video, the selected audio track and the subtitle track are transcoded by
+###   separate ffmpegs at the same time, then muxed (without reencoding) into the destination with the input
+###   chapters.  Audio and subtitles go to a cache folder next to the output, named after their settings.  The
+###   cache is only removed once the mux succeeds, so after a failed video encode the retry redoes the video
+###   alone.  Works with segmentEncode (the segments become the video).
+###
+### - The script only runs when started directly, so its functions can be imported.  Tests in tests/ (e.g. track
+###   selection checked against the original deep search on randomised probes) run with python -m pytest from
+###   the repo folder.
+###
 ### vidChew3 was born out of a desire to translate vidChew2 to Python.  This was primarily an academic effort
 ### to teach myself a little Python, but I also wished to design a more reliable audio selection algorithm
 ### (for lack of a better word).  As it turns out, Python is quite a bit faster than bash, too ;P.  This is
@@ -117,7 +246,12 @@ ver = "0412181217"
 ###
 ################################################################################################################
 
-import os, sys, json, string, re, subprocess, logging, time, datetime, types
+import os, sys, errno, json, string, re, subprocess, logging, logging.handlers, atexit, gzip, tempfile, time, datetime, types, threading, queue, sqlite3, hashlib, shutil, socket, shlex, signal, itertools, heapq, concurrent.futures, select, struct, ctypes, ctypes.util
+
+try:
+	from compression import zstd
+except ImportError:
+	zstd = None
 
 ### Get current working directory, add it to path (for config file), and start timers
 
@@ -127,111 +261,232 @@ sys.path.insert(0, runFrom)
 startTime = datetime.datetime.now().strftime("%m/%d/%y %H:%M:%S")
 startTimer = time.time()
 
-### Determine whether config file exists
+##### Default Config #####
 
-configPath = runFrom + "/" + "vidChew3conf.py"
+### Do everything except encode
+dryRun = True
+### Print out some extra debug text
+### Really only useful for seeing the audio track selection logic
+debug = False
 
-if os.path.isfile(configPath):
-	
-	usingConfig = True
-	from vidChew3conf import *	
-	
-else:
-	
-	usingConfig = False
-	
-##### Default Config #####
+### Log all vidChew3 output (not including ffmpeg output)
+doLogFile = True
+### Generate a log for each ffmpeg invocation
+ffmpegLogs = True
+### Compression for ffmpeg logs, "gzip" or "zstd" (zstd needs Python 3.14+)
+reportCompression = "gzip"
+### Also write log lines & job events (planned/start/done/failed/skipped...) as JSON lines to this file in the input folder ("" = off)
+eventsFile = ""
 
-	### Do everything except encode
-	dryRun = True
-	### Print out some extra debug text
-	### Really only useful for seeing the audio track selection logic
-	debug = False
-
-	### Log all vidChew3 output (not including ffmpeg output)
-	doLogFile = True
-	### Generate a log for each ffmpeg invocation
-	ffmpegLogs = True
-
-	### Exit the script if ffmpeg fails
-	exitOnFail = False
-
-	### Output directory for encodes
-	destDir = ""
-
-	### fileTag will be appended to the end of output filenames
-	fileTag = "-myTag"
-	
-	### Filenames containing a string in filenameSkipArray will be skipped
-	filenameSkipArray = [fileTag, 'vidChew']
-
-	### Desired language for audio/subtitle track in ISO 639-2 format
-	### https://en.wikipedia.org/wiki/List_of_ISO_639-2_codes
-	targLang = "eng"
-
-	### ffmpeg video encoding settings
-	videoTargCodec = "libx265"
-	videoTargCodecPreset = "medium"
-	videoTargCrf = "22"
-	
-	### Video downscaling options
-	videoDownscale = True
-	maxVidWidth = 1920
-	maxVidHeight = 1080
-	force16 = True
-
-	### Preferred audio formats during deep search, prioritized from left to right.
-	### Leave a blank string at the end to include a pass for formats not in your list.
-	prefAudioFormats = ['ac3', 'eac3', 'dts', 'aac', '']
-
-	### Audio reencoding options
-	audioReenc = True
-	### Force reencode of audio, even if input bitrate is lower than target bitrate
-	audioReencForce = False
-	audioReencCodec = "ac3"
-	audioReencBitRateStereo = 256
-	audioReencBitRateSurround = 640
-	audioReencChannelsSurround = 6
-
-	### Audio downmixing options
-	audioDownmix = False
-	audioDownmixCodec = "libfdk_aac"
-	audioDownmixChannels = 2
-	audioDownmixBitRate = 256
+### Reuse ffprobe results from previous runs for unchanged files
+probeCache = True
+### Journal each job's progress so a restarted run skips finished work and resumes the rest
+journal = True
+### State database (probe cache & journal), kept in the input folder next to the logs
+stateDbFile = "vidChew3-state.db"
+
+### Seconds between live progress/ETA updates for running encodes (0 = off)
+progressInterval = 30
+### Append a metrics record (JSON lines) per encode to this file in the input folder ("" = off)
+metricsFile = "vidChew3-metrics.jsonl"
+
+### Exit the script if ffmpeg fails
+exitOnFail = False
+
+### Number of simultaneous encodes (0 = cpu count / coresPerJob)
+jobs = 1
+### Threads given to each encode (0 = let ffmpeg/x265 decide)
+coresPerJob = 0
+### Number of files probed at once ahead of the encoders
+probeJobs = 2
+### Number of probed & planned files allowed to wait for an encoder (0 = no limit, the whole library is
+### probed ahead so schedulePolicy sees every job)
+prefetchDepth = 4
+### Order waiting jobs are encoded in: "fifo" (walk order), "savings" (most expected bytes saved per cpu-second first)
+### or "lpt" (longest expected encode first, so the batch finishes as early as possible)
+schedulePolicy = "fifo"
+### Most encodes reading from or writing to the same device (st_dev of input & output folder) at once (0 = no limit)
+jobsPerDevice = 0
+
+### Only start & run encodes inside these windows ("[days] HH:MM-HH:MM", e.g. "Mon-Fri 22:00-07:00", "Sat-Sun 00:00-24:00"),
+### outside them running ffmpegs are suspended and resumed when a window opens ([] = any time)
+encodeWindows = []
+### Raise or lower the number of running encodes (and pause them with SIGSTOP) to leave room for other workloads
+resourceGovernor = False
+### Seconds between governor (and encodeWindows) checks
+governorInterval = 10
+### Encodes are cut back when the 1 min load average left by other processes exceeds governorMaxLoad per cpu,
+### MemAvailable drops below governorMinMemory percent, or memory/io pressure (/proc/pressure "some" avg10)
+### exceeds governorMaxPressure percent
+governorMaxLoad = 0.5
+governorMinMemory = 10
+governorMaxPressure = 20
+### Nice level (0-19) of encoders, and their ionice class ("best-effort", "idle" or "" = unchanged) & best-effort level (0-7)
+encodeNice = 0
+encodeIoClass = ""
+encodeIoLevel = 7
+
+### Split long inputs into segments (on chapters if present) and encode them in parallel
+segmentEncode = False
+### Only segment inputs at least this long (seconds)
+segmentMinDuration = 3600
+### Minimum segment length (seconds), also the split interval for inputs without chapters
+segmentLength = 600
+### Number of segments of one input encoded at once
+segmentJobs = 4
+
+### Encode video, audio & subtitles in separate ffmpegs at once, then mux them.  Audio & subtitles are cached
+### next to the output until the mux succeeds, so a failed video encode is retried alone.
+streamPipeline = False
+
+### Sample encode a few short pieces of each input (with the real settings) and predict its savings first
+sampleEncode = False
+### Number of samples, spread through the input and encoded at once, and their length (seconds)
+sampleCount = 3
+sampleLength = 20
+### Inputs predicted to save less than this (percent) are skipped ("skip") or encoded & flagged in the log ("flag")
+sampleMinSavings = 10
+sampleAction = "skip"
+
+### Tune CRF per input by binary searching on sampled pieces (sampleCount x sampleLength) for a video bitrate target
+autoCrf = False
+### Target video bitrate (kb/s) per resolution class, the first class <= the output height applies
+autoCrfBitRates = {2160: 12000, 1080: 4000, 720: 2200, 0: 1200}
+### Lowest & highest CRF the search may pick (videoTargCrf is used for inputs too short to sample)
+autoCrfRange = [16, 30]
+
+### Run mode
+###   "encode"      - walk the current directory and encode (default)
+###   "coordinator" - walk and plan only, writing jobs to queueDir for workers
+###   "worker"      - encode jobs from queueDir (any host mounting the share at the same path)
+###   "bench"       - encode synthetic clips across the bench* settings below and report throughput
+###   "plan"        - walk and plan only, then predict cpu-hours, wall-clock & output size from metricsFile history
+###   "watch"       - encode the current directory, then keep watching it (inotify, or polling) for new files
+runMode = "encode"
+### Shared queue directory for coordinator/worker mode
+queueDir = ""
+### Seconds between worker heartbeats / queue polls
+queueHeartbeat = 30
+queuePoll = 10
+### Jobs whose worker hasn't heartbeat in this many seconds are put back in the queue
+queueStaleAfter = 300
+
+### Watch mode: new files must keep the same size & mtime for watchSettle seconds before they're encoded
+watchSettle = 60
+### Seconds between rescans when inotify isn't available (or runs out of watches)
+watchPoll = 300
+
+### Bench mode: clips & outputs go in benchDir, results in benchFile (both in the current directory)
+benchDir = "vidChew3-bench"
+benchFile = "vidChew3-bench.jsonl"
+### lavfi sources, sizes, durations (seconds) and frame rate of the synthetic clips
+benchSources = ['testsrc2', 'mandelbrot']
+benchSizes = ['1280x720', '1920x1080', '3840x2160']
+benchDurations = [10, 30]
+benchRate = 24
+### Settings matrix, every combination is encoded (benchThreads sets coresPerJob, benchJobs sets jobs)
+benchPresets = ['fast', 'medium']
+benchCrfs = ['22']
+benchThreads = [0]
+benchJobs = [1, 2]
+
+### Output directory for encodes
+destDir = ""
+### Write encodes (and segments/samples) to this local scratch folder, then move them to their destination in the background ("" = off)
+scratchDir = ""
+### Number of finished outputs moved to their destination at once
+offloadJobs = 1
+### Stage upcoming inputs while the current encodes run: "copy" them to scratchDir, "fadvise" (pre-read into
+### the page cache with posix_fadvise WILLNEED), or "" (off)
+inputStaging = ""
+### Most GB of inputs staged at once, copied to scratchDir or pre-read (larger inputs are read in place)
+stagingBudget = 50
+
+### Only files with these extensions are probed ([] = probe everything)
+mediaExtensions = ['.mkv', '.mp4', '.m4v', '.avi', '.mov', '.wmv', '.ts', '.m2ts', '.mpg', '.mpeg', '.vob', '.webm', '.flv']
+### Files smaller than this (MB) are never probed
+minInputSize = 1
+### Folder names that are never walked (hidden folders, destDir & queueDir never are either)
+excludeDirs = []
+
+### fileTag will be appended to the end of output filenames
+fileTag = "-myTag"
+
+### Filenames containing a string in filenameSkipArray will be skipped
+filenameSkipArray = [fileTag, 'vidChew']
+
+### Desired language for audio/subtitle track in ISO 639-2 format
+### https://en.wikipedia.org/wiki/List_of_ISO_639-2_codes
+targLang = "eng"
+
+### ffmpeg video encoding settings
+videoTargCodec = "libx265"
+videoTargCodecPreset = "medium"
+videoTargCrf = "22"
+
+### Video downscaling options
+videoDownscale = True
+maxVidWidth = 1920
+maxVidHeight = 1080
+force16 = True
+
+### Preferred audio formats during deep search, prioritized from left to right.
+### Leave a blank string at the end to include a pass for formats not in your list.
+prefAudioFormats = ['ac3', 'eac3', 'dts', 'aac', '']
+
+### Audio reencoding options
+audioReenc = True
+### Force reencode of audio, even if input bitrate is lower than target bitrate
+audioReencForce = False
+audioReencCodec = "ac3"
+audioReencBitRateStereo = 256
+audioReencBitRateSurround = 640
+audioReencChannelsSurround = 6
+
+### Audio downmixing options
+audioDownmix = False
+audioDownmixCodec = "libfdk_aac"
+audioDownmixChannels = 2
+audioDownmixBitRate = 256
 
 ##### Default Config End #####
 
 ##### Functions #####
 
-### Define a function that changes log handlers to produce blank lines without a prefix
+### Blank lines are log records flagged "blank", written without a prefix (and left out of the event stream)
 
 def log_newline(self, how_many_lines=1):
 	
-	self.removeHandler(self.console_handler)
-	if doLogFile: self.removeHandler(self.file_handler)
-	self.addHandler(self.blank_handler)
-	if doLogFile: self.addHandler(self.file_handler_blank)
 	for i in range(how_many_lines):
-		self.info('')
+		self.info("", extra={"blank": True})
+
+class TextLogFormatter(logging.Formatter):
+	
+	def format(self, record):
+		if getattr(record, "blank", False): return ""
+		return super().format(record)
+
+### One JSON object per record, with the job (input path) it belongs to and any event fields
 
-	self.removeHandler(self.blank_handler)
-	if doLogFile: self.removeHandler(self.file_handler_blank)
-	self.addHandler(self.console_handler)
-	if doLogFile: self.addHandler(self.file_handler)
+class JsonLogFormatter(logging.Formatter):
 	
-### Create a logger object to handle text output and optionally write a logfile
+	def format(self, record):
+		event = dict(getattr(record, "fields", {}))
+		event.update({"time": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"), "event": getattr(record, "event", "log"), "job": getattr(record, "job", None), "thread": record.threadName})
+		if event["event"] == "log": event["msg"] = record.getMessage()
+		return json.dumps(event)
 
-def create_logger(loggingType=0, loggingPath=""):
+### Create a logger object to handle text output and optionally write a logfile & event stream.  Handlers run
+### on a QueueListener thread, so logging from jobs only costs an enqueue.
+
+def create_logger(loggingType=0, loggingPath="", eventsPath=""):
 	
-	logFormatter = logging.Formatter("[vidChew3] : %(asctime)s %(message)s",  "%m%d%y%H%M%S")
+	logFormatter = TextLogFormatter("[vidChew3] : %(asctime)s %(message)s",  "%m%d%y%H%M%S")
 
 	console_handler = logging.StreamHandler(sys.stdout)
 	console_handler.setLevel(logging.INFO)
 	console_handler.setFormatter(logFormatter)
-
-	blank_handler = logging.StreamHandler()
-	blank_handler.setLevel(logging.INFO)
-	blank_handler.setFormatter(logging.Formatter(fmt=''))
+	handlers = [console_handler]
 	
 	if loggingType == 1:
 		
@@ -240,901 +495,2661 @@ def create_logger(loggingType=0, loggingPath=""):
 		file_handler = logging.FileHandler("{0}/{1}.log".format(loggingPath,logFilename))
 		file_handler.setLevel(logging.INFO)
 		file_handler.setFormatter(logFormatter)
+		handlers.append(file_handler)
+	
+	if eventsPath != "":
 		
-		logDate = '{0:%m%d%y%H%M%S}'.format(datetime.datetime.now())
-		logFilename = "vidChew3-" + logDate
-		file_handler_blank = logging.FileHandler("{0}/{1}.log".format(loggingPath,logFilename))
-		file_handler_blank.setLevel(logging.INFO)
-		file_handler_blank.setFormatter(logging.Formatter(fmt=''))
+		events_handler = logging.FileHandler(eventsPath)
+		events_handler.setLevel(logging.DEBUG)
+		events_handler.setFormatter(JsonLogFormatter())
+		events_handler.addFilter(lambda record: not getattr(record, "blank", False))
+		handlers.append(events_handler)
+	
+	logQueue = queue.SimpleQueue()
+	listener = logging.handlers.QueueListener(logQueue, *handlers, respect_handler_level=True)
+	listener.start()
+	atexit.register(listener.stop)
 
 	logger = logging.getLogger('logging_test')
-	logger.setLevel(logging.INFO)
-	logger.addHandler(console_handler)
-	if loggingType == 1: logger.addHandler(file_handler)
-
-	logger.console_handler = console_handler
-	logger.blank_handler = blank_handler
-	if loggingType == 1: logger.file_handler = file_handler
-	if loggingType == 1: logger.file_handler_blank = file_handler_blank
+	logger.setLevel(logging.DEBUG if eventsPath != "" else logging.INFO)
+	logger.addHandler(logging.handlers.QueueHandler(logQueue))
+	logger.listener = listener
 	logger.newline = types.MethodType(log_newline, logger)
 
 	return logger
+
+### Add a job event to the event stream (eventsFile), job is the input path
+
+def log_event(event, job=None, **fields):
 	
-##### Functions End #####
+	if eventsFile != "": logger.debug(event, extra={"event": event, "job": job, "fields": fields})
+	
+### Open (or create) the state database kept next to the logs
+
+def open_state_db(dbPath):
+	
+	db = sqlite3.connect(dbPath, check_same_thread=False)
+	db.execute("PRAGMA journal_mode=WAL")
+	db.execute("PRAGMA synchronous=NORMAL")
+	db.execute("CREATE TABLE IF NOT EXISTS probes (dev INTEGER, ino INTEGER, size INTEGER, mtime INTEGER, path TEXT, probe TEXT, PRIMARY KEY (dev, ino))")
+	db.execute("CREATE TABLE IF NOT EXISTS journal (input TEXT PRIMARY KEY, dest TEXT, planHash TEXT, status TEXT, outSize INTEGER, updated REAL, savings REAL)")
+	if "savings" not in [column[1] for column in db.execute("PRAGMA table_info(journal)")]:
+		db.execute("ALTER TABLE journal ADD COLUMN savings REAL")
+	db.execute("CREATE TABLE IF NOT EXISTS crfTuning (folder TEXT, targetRes TEXT, codec TEXT, preset TEXT, bitRate INTEGER, crf TEXT, updated REAL, PRIMARY KEY (folder, targetRes, codec, preset, bitRate))")
+	db.commit()
+	return db
 
-### Check for an argument
+### Run ffprobe on an input, reusing the cached result if dev/inode/size/mtime are unchanged
+### Returns the parsed json, or None if ffprobe can't read the input (failures are cached too)
 
-if len(sys.argv) > 1:
-	print("!! This script doesn't accept any arguments!")
-	print("!! It's intended to run recursively on the current directory")
-	quit()
-else:
-	specifiedInputFolder = "."
+def probe_input(inputAbsPath, inputStat):
+	
+	cacheKey = (inputStat.st_dev, inputStat.st_ino)
+	cacheStamp = (inputStat.st_size, inputStat.st_mtime_ns)
+	
+	if probeCache:
+		with dbLock:
+			row = stateDb.execute("SELECT size, mtime, probe FROM probes WHERE dev=? AND ino=?", cacheKey).fetchone()
+		if row is not None and (row[0], row[1]) == cacheStamp:
+			if row[2] == "": return None
+			return json.loads(row[2])
+	
+	try:
+		jsonBytes = subprocess.check_output(["ffprobe", "-v", "quiet", inputAbsPath, "-print_format", "json", "-show_format", "-show_streams", "-show_chapters"])
+		jsonText = jsonBytes.decode('utf-8')
+	except subprocess.CalledProcessError as ffprobeexc:
+		jsonText = ""
 	
-### Check to see if destDir exists
+	if probeCache:
+		with dbLock:
+			stateDb.execute("INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?, ?, ?)", cacheKey + cacheStamp + (inputAbsPath, jsonText))
+			stateDb.commit()
+	
+	if jsonText == "": return None
+	return json.loads(jsonText)
 
-if destDir != "":
-	if os.path.isdir(destDir) == False:
-		print("!! destDir (%s) does not exist!" % destDir)
-		quit()
+### Record a job's state (pending/running/done/failed/skipped) in the run journal
+
+def journal_set(inputAbsPath, finalDest, planHash, status, outSize=None, savings=None):
 	
-### Create logger for status output / log writing
+	with dbLock:
+		stateDb.execute("INSERT OR REPLACE INTO journal (input, dest, planHash, status, outSize, updated, savings) VALUES (?, ?, ?, ?, ?, ?, ?)", (inputAbsPath, finalDest, planHash, status, outSize, time.time(), savings))
+		stateDb.commit()
+
+### A job is done only if the journal says so for the same plan and the output is still there, whole
 
-if doLogFile:
-	logFolder = os.path.abspath(specifiedInputFolder)
-	logger = create_logger(1, logFolder)
-else:
-	logger = create_logger()
+def journal_is_done(inputAbsPath, finalDest, planHash):
 	
-### Say hello!
+	with dbLock:
+		row = stateDb.execute("SELECT dest, planHash, status, outSize FROM journal WHERE input=?", (inputAbsPath,)).fetchone()
+	if row is None: return False
+	if row[2] != "done" or row[0] != finalDest or row[1] != planHash: return False
+	try:
+		return os.stat(finalDest).st_size == row[3]
+	except OSError:
+		return False
 
-inputFolder = os.path.abspath(specifiedInputFolder)
+### A job skipped by the sample pass stays skipped while its plan is the same, sampling still skips, and its
+### predicted savings are still below sampleMinSavings
+
+def journal_is_skipped(inputAbsPath, planHash):
 	
-logger.newline()
-logger.info("!! vidChew3 by \m/rr :: %s" % ver)
-logger.info("!! startTime: %s" % str(startTime))
-logger.info("!! inputFolder: %s" % inputFolder)
-if usingConfig: logger.info("++ Using config: %s" % configPath)
-if not usingConfig: logger.info("-- Using internal config")
-if dryRun: logger.info("-- Dry run enabled!")
-if debug: logger.info("** Debugging output enabled!")
+	if not sampleEncode or sampleAction != "skip": return False
+	with dbLock:
+		row = stateDb.execute("SELECT planHash, status, savings FROM journal WHERE input=?", (inputAbsPath,)).fetchone()
+	return row is not None and row[1] == "skipped" and row[0] == planHash and row[2] is not None and row[2] < sampleMinSavings
 
-if audioReenc and audioDownmix:
-	logger.newline()
-	logger.info("!! Audio reencoding and downmixing cannot both be enabled!")
-	logger.newline()
-	quit()
+### Clean up after a run that died mid-encode, partial outputs are removed and their jobs redone
+
+def journal_recover():
 	
-### Walk input folder and process
+	with dbLock:
+		rows = stateDb.execute("SELECT input, dest FROM journal WHERE status='running'").fetchall()
+	for inputAbsPath, finalDest in rows:
+		logger.info("-- Unfinished job from a previous run: %s" % inputAbsPath)
+		for partialDest in (finalDest, finalDest + ".vidChew3-part"):
+			if os.path.isfile(partialDest):
+				os.remove(partialDest)
+				logger.info("-- Removed partial output: %s" % partialDest)
+		with dbLock:
+			stateDb.execute("UPDATE journal SET status='failed', updated=? WHERE input=?", (time.time(), inputAbsPath))
+			stateDb.commit()
 
-for root, subdirs, files in os.walk(inputFolder):
-	for filename in sorted(files):
-		
-		silentSkipArray = ['vidChew3']
-		doSilentSkip = False
-		
-		for silentSkip in silentSkipArray:
-			if silentSkip in filename:
-				if debug: logger.info("** Filename contains \"%s\" (silent skip)!" % (silentSkip))
-				doSilentSkip = True
-		if doSilentSkip: continue
-		
-		fullInputFile = os.path.join(root, filename)
-		inputAbsPath = os.path.abspath(fullInputFile)
-		inputPath, inputFile = os.path.split(inputAbsPath)
-		inputBaseFile = os.path.splitext(inputFile)[0]
-		logger.newline()
-		logger.info("-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+")
-		logger.info('! Input: %s' % (inputFile))
-		logger.info('! Folder: %s' % (root))
-		logger.info("-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+")
-		logger.newline()
-		
-		### Determine whether or not to skip based on filenameSkipArray
-		
-		doSkip = False
-			
-		for skip in filenameSkipArray:
-			if skip in inputFile:
-				logger.info("!! Filename contains \"%s\"!  Skipping..." % (skip))
-				doSkip = True
-		if doSkip: continue
-		
-		### Obtain input filesize, convert to MB
-		
-		inputSize = os.stat(inputAbsPath)
-		inputSize = int(inputSize.st_size) / 1000000
-		inputSize = str(round(inputSize, 2))
+### Remove inputs a crashed run left staged in scratchDir (they aren't counted against stagingBudget)
+
+def staging_recover():
+	
+	for stagedFile in os.listdir(scratchDir):
+		if not stagedFile.startswith("vidChew3-input-"): continue
+		os.remove(os.path.join(scratchDir, stagedFile))
+		logger.info("-- Removed staged input from a previous run: %s" % stagedFile)
+
+### Format an ffmpeg argv (and FFREPORT value, if any) as a copy & pasteable shell command
+
+def format_cmd(args, reportEnv=""):
+	
+	if reportEnv: return "FFREPORT=" + shlex.quote(reportEnv) + " " + shlex.join(args)
+	return shlex.join(args)
+
+### Stream an ffmpeg report into a compressed file (reportDest + reportSuffix) as ffmpeg writes it, through a
+### FIFO in a local temp folder, so the uncompressed report never hits the disk.  Returns (fifoPath, thread).
 
-		### Obtain ffprobe output in json format, decode, and parse
+def open_report_stream(reportDest):
+	
+	fifoPath = os.path.join(tempfile.mkdtemp(prefix="vidChew3-report-"), "report.log")
+	os.mkfifo(fifoPath)
+	
+	def stream_report():
+		with open(fifoPath, "rb") as reportIn:
+			if reportCompression == "zstd":
+				reportOut = zstd.open(reportDest + reportSuffix, "wb")
+			else:
+				reportOut = gzip.open(reportDest + reportSuffix, "wb", compresslevel=6)
+			with reportOut:
+				shutil.copyfileobj(reportIn, reportOut, 1024 * 1024)
+	
+	reportThread = threading.Thread(target=stream_report, name="report", daemon=True)
+	reportThread.start()
+	return fifoPath, reportThread
+
+### Finish a report stream once ffmpeg has exited.  If ffmpeg never opened the report, briefly opening the
+### FIFO for writing releases the reader (which then sees EOF).
+
+def close_report_stream(reportStream):
+	
+	fifoPath, reportThread = reportStream
+	try:
+		os.close(os.open(fifoPath, os.O_WRONLY | os.O_NONBLOCK))
+	except OSError:
+		pass
+	reportThread.join()
+	shutil.rmtree(os.path.dirname(fifoPath), ignore_errors=True)
+
+### Run ffmpeg for a job.  If progressKey is given (and progressInterval is set), ffmpeg's -progress
+### output is parsed into job["progress"][progressKey] for the progress reporter.  Returns the exit code.
 
+def run_ffmpeg(job, args, reportEnv="", progressKey=None):
+	
+	env = None
+	reportStream = None
+	if reportEnv:
+		reportStream = open_report_stream(job["reportDest"])
+		env = dict(os.environ, FFREPORT=reportEnv.replace("file=" + job["reportDest"], "file=" + reportStream[0], 1))
+	
+	if progressKey is None or progressInterval <= 0:
+		ffmpegProc = subprocess.Popen(launchPrefix + args, stdin=subprocess.DEVNULL, env=env)
+		encodeGovernor.register(ffmpegProc.pid)
+	else:
+		ffmpegProc = subprocess.Popen(launchPrefix + args[:1] + ["-progress", "pipe:1"] + args[1:], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, env=env, universal_newlines=True)
+		encodeGovernor.register(ffmpegProc.pid)
+		progress = {}
+		for line in ffmpegProc.stdout:
+			key, sep, value = line.strip().partition("=")
+			if not sep: continue
+			progress[key] = value
+			if key == "progress":
+				update_progress(job, progressKey, progress)
+		ffmpegProc.stdout.close()
+	
+	### Reap ffmpeg ourselves to get its own cpu time & peak rss
+	### (getrusage(RUSAGE_CHILDREN) would lump together every job running concurrently).
+	### The governor lets go of it before it's reaped, so its pid is never signalled after reuse.
+	
+	os.waitid(os.P_PID, ffmpegProc.pid, os.WEXITED | os.WNOWAIT)
+	encodeGovernor.unregister(ffmpegProc.pid)
+	pid, waitStatus, usage = os.wait4(ffmpegProc.pid, 0)
+	ffmpegProc.returncode = os.waitstatus_to_exitcode(waitStatus)
+	if reportStream is not None: close_report_stream(reportStream)
+	with progressLock:
+		rusage = job.setdefault("rusage", [0.0, 0.0, 0])
+		rusage[0] += usage.ru_utime
+		rusage[1] += usage.ru_stime
+		rusage[2] = max(rusage[2], usage.ru_maxrss)
+	return ffmpegProc.returncode
+
+### Store the latest out_time (sec), fps, speed, bytes written and frames from an ffmpeg -progress block
+
+def update_progress(job, progressKey, progress):
+	
+	def to_float(value):
 		try:
-			jsonBytes = subprocess.check_output(["ffprobe", "-v", "quiet", inputAbsPath, "-print_format", "json", "-show_format", "-show_streams"])
-		except subprocess.CalledProcessError as ffprobeexc:
-			logger.info("!! Could not retrieve input video info via ffprobe!")
-			logger.newline()
-			continue
-		
-		jsonText = jsonBytes.decode('utf-8')
+			return float(value.rstrip("x"))
+		except ValueError:
+			return 0.0
+	
+	outTime = to_float(progress.get("out_time_us", "N/A")) / 1000000
+	
+	### A finished ffmpeg (or segment) no longer contributes to fps/speed
+	
+	if progress["progress"] == "end":
+		fps, speed = 0.0, 0.0
+	else:
+		fps, speed = to_float(progress.get("fps", "N/A")), to_float(progress.get("speed", "N/A"))
+	
+	with progressLock:
+		job["progress"][progressKey] = (outTime, fps, speed, to_float(progress.get("total_size", "N/A")), to_float(progress.get("frame", "N/A")))
 
-		data = json.loads(jsonText)
-		
-		### Determine overall bitrate of input
-		
-		if "bit_rate" in data["format"]:
-			overallBitrate = data["format"]["bit_rate"]
-			overallBitrate = int(overallBitrate) / 1000
-			overallBitrate = str(round(overallBitrate, 2))
-		else:
-			overallBitrate = "unknown"
-		
-		### Count streams
+### Append a job's metrics record to metricsFile and add it to the run totals
 
-		logger.info("-+- Track Selection -+-")
-		logger.newline()
-		logger.info("++ Number of streams: %s (%s MB | %s kb/s)" % (len(data["streams"]), inputSize, overallBitrate))
-		logger.newline()
-		
-		### Choose first video track
-		
-		logger.info(":: Video")
-		
-		videoFound = False
-		bfVideoIndex = 0
-		bfVideoCodecName =""
-		bfVideoBitrate = 0
-		bfVideoBitrateDisplay = ""
-		bfVideoWidth = ""
-		bfVideoHeight = ""
-		bfVideoDisplayAr = ""
-		targVidTrack = ""
-		targVidTrack = ""
-					
-		for i in data["streams"]:
-			if i["codec_type"] == "video":
-				if 'index' in i:
-					index = i["index"]
-				else:
-					index = "unknown"
-				if 'codec_name' in i:
-					codecName = i["codec_name"]
-				else:
-					codecName = "unknown"
-				if 'bit_rate' in i:
-					bitRate = i["bit_rate"]
-					bitRate = int(bitRate) / 1000
-					bitRate = int(bitRate)
-					bitRateDisplay = bitRate
-				else:
-					bitRate = 0
-					bitRateDisplay = "unknown"
-				if 'width' in i:
-					width = i["width"]
-				else:
-					width = "unknown"
-				if 'height' in i:
-					height = i["height"]
-				else:
-					height = "unknown"
-				if 'display_aspect_ratio' in i:
-					ar = i["display_aspect_ratio"]
-				else:
-					ar = "unknown"
-				
-				bfVideoIndex = index
-				bfVideoCodecName = codecName
-				bfVideoBitrate = bitRate
-				bfVideoBitrateDisplay = bitRateDisplay
-				bfVideoWidth = width
-				bfVideoHeight = height
-				bfVideoDisplayAr = ar
-				videoFound = True
-				break		
-						
-		if videoFound:
-			logger.info("!! Chose first video track!")
-			logger.info("\t index: %s | codecName: %s | Resolution: %sx%s (%s)" % (bfVideoIndex, bfVideoCodecName, bfVideoWidth, bfVideoHeight, bfVideoDisplayAr))
-			targVidTrack = str(bfVideoIndex)
-			targVidTrackMap = "-map 0:" + targVidTrack
+def write_metrics(job, status, wallTime, outputBytes):
+	
+	rusage = job.get("rusage", [0.0, 0.0, 0])
+	frames = sum(p[4] for p in job.get("progress", {}).values())
+	
+	record = {
+		"time": datetime.datetime.now().isoformat(timespec="seconds"),
+		"input": job["inputAbsPath"],
+		"output": job["finalDest"],
+		"status": status,
+		"wallTime": round(wallTime, 2),
+		"cpuUser": round(rusage[0], 2),
+		"cpuSys": round(rusage[1], 2),
+		"peakRssMB": round(rusage[2] / 1024, 1),
+		"sourceRes": job["sourceRes"],
+		"targetRes": job["targetRes"],
+		"sourceCodec": job["sourceCodec"],
+		"codec": job["videoCodec"],
+		"preset": job["preset"],
+		"crf": job["crf"],
+		"duration": job["inputDuration"],
+		"inputBytes": job["inputBytes"],
+		"outputBytes": outputBytes,
+		"fps": round(frames / wallTime, 2) if frames and wallTime > 0 else None,
+		"speed": round(job["inputDuration"] / wallTime, 3) if wallTime > 0 else None,
+		"predictedSavings": job.get("predictedSavings"),
+	}
+	
+	with metricsLock:
+		runTotals["cpuSeconds"] += rusage[0] + rusage[1]
+		if status == "done":
+			runTotals["encoded"] += 1
+			runTotals["inputBytes"] += job["inputBytes"]
+			runTotals["outputBytes"] += outputBytes
+		elif status == "skipped":
+			runTotals["skipped"] += 1
 		else:
-			logger.info("!! No video track found!")
-			
+			runTotals["failed"] += 1
+		if metricsFile != "":
+			with open(metricsPath, "a") as metricsOut:
+				metricsOut.write(json.dumps(record) + "\n")
+	log_event(status, job["inputAbsPath"], **record)
 
-		### Count & display all audio streams
-		
-		logger.newline()
-		logger.info(":: Audio")
+### Generate a deterministic synthetic clip from an ffmpeg lavfi source (with 5.1 ac3 audio)
 
-		audioStreamCount = 0
-		for i in data["streams"]:
-			if i["codec_type"] == 'audio':
-				audioStreamCount += 1
-		logger.info("++ Number of audio streams: %s" % (audioStreamCount))
-		
-		for i in data["streams"]:
-				if i["codec_type"] == "audio":
-					if 'index' in i:
-						index = i["index"]
-					else:
-						index = "unknown"
-					if "tags" in i:
-						if 'language' in i["tags"]:
-							language = i["tags"]["language"]
-						else:
-							language = "unknown"
-					else:
-						language = "unknown"
-					if 'codec_name' in i:
-						codecName = i["codec_name"]
-					else:
-						codecName = "unknown"
-					if 'channels' in i:
-						channels = i["channels"]
-						channels = int(channels)
-						channelsDisplay = channels
-					else:
-						channels = 0
-						channelsDisplay = "unknown"
-					if 'bit_rate' in i:
-						bitRate = i["bit_rate"]
-						bitRate = int(bitRate) / 1000
-						bitRate = int(bitRate)
-						bitRateDisplay = bitRate
-					elif codecName == "dts":
-						if 'profile' in i:
-							if i['profile'] == "DTS-HD MA":
-								codecName = "dts-hd ma"
-								bitRate = 1536
-								bitRateDisplay = str(bitRate)
-							else:
-								bitRate = 0
-								bitRateDisplay = "unknown"	
-						else:
-							bitRate = 0
-							bitRateDisplay = "unknown"
-					elif codecName == "truehd":
-						bitRate = 18000
-						bitRateDisplay = str(bitRate) + " (max)"
-					else:
-						bitRate = 0
-						bitRateDisplay = "unknown"
-					
-					logger.info("\t index: %s | language: %s | codecName: %s | channels: %s | bitRate: %s kb/s" % (index, language, codecName, channelsDisplay, bitRateDisplay))
-
-		### Determine audio stream
-
-		audioFound = False
-		bfAudioIndex = ""
-		bfAudioLanguage = ""
-		bfAudioCodecName = ""
-		bfAudioChannels = 0
-		bfAudioChannelsDisplay = ""
-		bfAudioBitrate = 0
-		bfAudioBitrateDisplay = ""
-		targAudioTrack = ""
-		targAudioTrackMap = ""
-		targAudioTrackTag = ""
-
-		if audioStreamCount == 1:
-			logger.info("++ Only one audio track found, choosing...")
-			for i in data["streams"]:
-				if i["codec_type"] == "audio":
-					if 'index' in i:
-						index = i["index"]
-					else:
-						index = "unknown"
-					if "tags" in i:
-						if 'language' in i["tags"]:
-							language = i["tags"]["language"]
-						else:
-							language = "unknown"
-					else:
-						language = "unknown"
-					if 'codec_name' in i:
-						codecName = i["codec_name"]
-					else:
-						codecName = "unknown"
-					if 'channels' in i:
-						channels = i["channels"]
-						channels = int(channels)
-						channelsDisplay = channels
-					else:
-						channels = 0
-						channelsDisplay = "unknown"
-					if 'bit_rate' in i:
-						bitRate = i["bit_rate"]
-						bitRate = int(bitRate) / 1000
-						bitRate = int(bitRate)
-						bitRateDisplay = bitRate
-					elif codecName == "dts":
-						if 'profile' in i:
-							if i['profile'] == "DTS-HD MA":
-								codecName = "dts-hd ma"
-								bitRate = 1536
-								bitRateDisplay = str(bitRate)
-							else:
-								bitRate = 0
-								bitRateDisplay = "unknown"	
-						else:
-							bitRate = 0
-							bitRateDisplay = "unknown"
-					elif codecName == "truehd":
-						bitRate = 18000
-						bitRateDisplay = str(bitRate) + " max"
-					else:
-						bitRate = 0
-						bitRateDisplay = "unknown"
-					
-					if debug:
-						logger.info("** index: %s" % index)
-						logger.info("** language: %s" % language)
-						logger.info("** codecName: %s" % codecName)
-						logger.info("** channels: %s" % channelsDisplay)
-						logger.info("** bitRate (kbps): %s" % bitRateDisplay)
-						logger.newline()
-					
-					bfAudioIndex = index
-					bfAudioLanguage = language
-					bfAudioCodecName = codecName
-					bfAudioChannels = channels
-					bfAudioChannelsDisplay = channelsDisplay
-					bfAudioBitrate = bitRate
-					bfAudioBitrateDisplay = bitRateDisplay
-					audioFound = True
-					break
-
-		elif audioStreamCount > 1:
-			logger.info("++ Multiple audio tracks found, deep searching...")
-			for f in prefAudioFormats:
-				for i in data["streams"]:
-					if i["codec_type"] == "audio":
-						if 'index' in i:
-							index = i["index"]
-						else:
-							index = "unknown"
-						if "tags" in i:
-							if 'language' in i["tags"]:
-								language = i["tags"]["language"]
-							else:
-								language = "unknown"
-						else:
-							language = "unknown"
-						if 'codec_name' in i:
-							codecName = i["codec_name"]
-						else:
-							codecName = "unknown"
-						if 'channels' in i:
-							channels = i["channels"]
-							channels = int(channels)
-							channelsDisplay = channels
-						else:
-							channels = 0
-							channelsDisplay = "unknown"
-						if 'bit_rate' in i:
-							bitRate = i["bit_rate"]
-							bitRate = int(bitRate) / 1000
-							bitRate = int(bitRate)
-							bitRateDisplay = bitRate
-						elif codecName == "dts":
-							if 'profile' in i:
-								if i['profile'] == "DTS-HD MA":
-									codecName = "dts-hd ma"
-									bitRate = 1536
-									bitRateDisplay = str(bitRate)
-								else:
-									bitRate = 0
-									bitRateDisplay = "unknown"	
-							else:
-								bitRate = 0
-								bitRateDisplay = "unknown"
-						elif codecName == "truehd":
-							bitRate = 18000
-							bitRateDisplay = str(bitRate) + " max"
-						else:
-							bitRate = 0
-							bitRateDisplay = "unknown"
-						
-						if debug:
-							logger.info("** f: %s", f)
-							logger.info("** index: %s" % index)
-							logger.info("** language: %s" % language)
-							logger.info("** codecName: %s" % codecName)
-							logger.info("** channels: %s" % channelsDisplay)
-							logger.info("** bitRate (kbps): %s" % bitRateDisplay)
-							logger.newline()
-						
-						if f != "":
-							if (language == targLang and codecName == f and channels > bfAudioChannels):
-								if debug == 1:
-									logger.info("** This is the best found audio track!")
-									logger.newline()
-								bfAudioIndex = index
-								bfAudioLanguage = language
-								bfAudioCodecName = codecName
-								bfAudioChannels = channels
-								bfAudioChannelsDisplay = channelsDisplay
-								bfAudioBitrate = bitRate
-								bfAudioBitrateDisplay = bitRateDisplay
-								audioFound = True
-						else:
-							if (language == targLang and channels > bfAudioChannels):
-								if debug == 1:
-									logger.info("** This is the best found audio track!")
-									logger.newline()
-								bfAudioIndex = index
-								bfAudioLanguage = language
-								bfAudioCodecName = codecName
-								bfAudioChannels = channels
-								bfAudioChannelsDisplay = channelsDisplay
-								bfAudioBitrate = bitRate
-								bfAudioBitrateDisplay = bitRateDisplay
-								audioFound = True
-							elif (channels > bfAudioChannels):
-								if debug == 1:
-									logger.info("** This is the best found audio track!")
-									logger.newline()
-								bfAudioIndex = index
-								bfAudioLanguage = language
-								bfAudioCodecName = codecName
-								bfAudioChannels = channels
-								bfAudioChannelsDisplay = channelsDisplay
-								bfAudioBitrate = bitRate
-								bfAudioBitrateDisplay = bitRateDisplay
-								audioFound = True											
+def make_bench_clip(clipPath, source, size, duration):
+	
+	clipArgs = ['ffmpeg', '-y', '-v', 'error', '-f', 'lavfi', '-i', "%s=size=%s:rate=%s" % (source, size, benchRate), '-f', 'lavfi', '-i', "sine=frequency=440:sample_rate=48000", '-t', str(duration), '-map', '0:v', '-map', '1:a', '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '12', '-c:a', 'ac3', '-b:a', '640k', '-ac', '6', '-metadata:s:a:0', 'language=' + targLang, clipPath]
+	logger.info("++ Generating clip: %s" % format_cmd(clipArgs))
+	return subprocess.call(clipArgs, stdin=subprocess.DEVNULL)
 
-		else:
-			logger.info("!! No audio tracks found!")
-			logger.newline()
-			audioFound = False
+### Benchmark mode, encode synthetic clips with the ffmpeg cmd vidChew3 would build for them, across
+### every combination of benchPresets, benchCrfs, benchThreads (coresPerJob) and benchJobs (encodes at once)
 
-		if audioFound:
-			logger.newline()
-			logger.info("!! Audio Track Chosen!")
-			logger.info("\t index: %s | language: %s | codecName: %s | channels: %s | bitRate: %s kb/s" % (bfAudioIndex, bfAudioLanguage, bfAudioCodecName, bfAudioChannelsDisplay, bfAudioBitrateDisplay))
-			logger.newline()
-			targAudioTrack = str(bfAudioIndex)
-			targAudioTrackMap = "-map 0:" + targAudioTrack
-			if bfAudioLanguage != "unknown":
-				targAudioTrackTag = "-metadata:s:1 language=" + bfAudioLanguage
-			else:
-				targAudioTrackTag = ""
-		else:
-			logger.info("!! No audio track found!")
-			logger.newline()
-			
-		### Count & display all subtitle streams
-		
-		logger.info(":: Subtitle")
-				
-		subStreamCount = 0
-		for i in data["streams"]:
-			if i["codec_type"] == 'subtitle':
-				subStreamCount += 1
-		logger.info("++ Number of subtitle streams: %s" % subStreamCount)
-
-		for i in data["streams"]:
-			if i["codec_type"] == "subtitle":
-				if 'index' in i:
-					index = i["index"]
-				else:
-					index = "unknown"
-				if "tags" in i:
-					if 'language' in i["tags"]:
-						language = i["tags"]["language"]
-					else:
-						language = "unknown"
-				else:
-					language = "unknown"
-				if 'codec_name' in i:
-					codecName = i["codec_name"]
-				else:
-					codecName = "unknown"
-				
-				logger.info("\t index: %s | language: %s | codecName: %s" % (index, language, codecName))
-				
-		### Determine targLang subtitle stream, if exist
-		
-		subtitleFound = False
-		bfSubtitleIndex = 0
-		bfSubtitleLanguage = ""
-		bfSubtitleCodecLang =""
-		targSubTrack = ""
-		targSubTrackMap = ""
-		targSubTrackTag = ""
-		subOpt = ""
-
-		for i in data["streams"]:
-			if i["codec_type"] == "subtitle":
-				if 'index' in i:
-					index = i["index"]
-				else:
-					index = "unknown"
-				if "tags" in i:
-					if 'language' in i["tags"]:
-						language = i["tags"]["language"]
-					else:
-						language = "unknown"
-				else:
-					language = "unknown"
-				if 'codec_name' in i:
-					codecName = i["codec_name"]
-				else:
-					codecName = "unknown"
-				
-				if (language == targLang):
-					if debug == 1:
-						logger.info("** This is the best found subtitle track!")
-						logger.newline()
-					bfSubtitleIndex = index
-					bfSubtitleLanguage = language
-					bfSubtitleCodecName = codecName
-					subtitleFound = True
-					break
-					
-		if subtitleFound:
-			logger.newline()
-			logger.info("!! Subtitle Track Chosen!")
-			logger.info("\t index: %s | language: %s | codecName: %s" % (bfSubtitleIndex, bfSubtitleLanguage, bfSubtitleCodecName))
-			targSubTrack = str(bfSubtitleIndex)
-			targSubTrackMap = "-map 0:" + targSubTrack
-			targSubTrackTag = "-metadata:s:2 language=" + bfSubtitleLanguage
-			if bfSubtitleCodecName == "hdmv_pgs_subtitle" or bfSubtitleCodecName == "dvd_subtitle":
-				subOpt = "-c:s copy"
-			else:
-				subOpt = ""
-		else:
-			logger.info("!! No %s subtitle track found!" %(targLang))
-			targSubTrack = ""
-			targSubTrackMap = ""
-			targSubTrackTag = ""	
-			
-		### Video downscaling
+def run_bench():
+	
+	global videoTargCodecPreset, videoTargCrf, coresPerJob, jobs, destDir, journal, ffmpegLogs, segmentEncode
+	
+	benchFolder = os.path.join(inputFolder, benchDir)
+	clipFolder = os.path.join(benchFolder, "clips")
+	outFolder = os.path.join(benchFolder, "out")
+	os.makedirs(clipFolder, exist_ok=True)
+	os.makedirs(outFolder, exist_ok=True)
+	benchPath = os.path.join(inputFolder, benchFile)
+	
+	destDir = outFolder
+	journal = False
+	ffmpegLogs = False
+	segmentEncode = False
+	results = []
+	
+	for source, size, duration in itertools.product(benchSources, benchSizes, benchDurations):
 		
-		doDownscale = False
-		doForce16 = False
+		clipFile = "%s-%s-%ss.mkv" % (source, size, duration)
+		if not os.path.isfile(os.path.join(clipFolder, clipFile)) and not dryRun:
+			if make_bench_clip(os.path.join(clipFolder, clipFile), source, size, duration) != 0:
+				logger.info("!! Could not generate %s, skipping..." % clipFile)
+				continue
 		
-		if videoDownscale:
-			if bfVideoWidth > maxVidWidth or bfVideoHeight > maxVidHeight:
-				doDownscale = True
-				scaleOpt = "-vf scale=" + str(maxVidWidth) + ":" + str(maxVidHeight)
-				targVidWidth = maxVidWidth
-				targVidHeight = maxVidHeight
-				if force16:
-					if bfVideoDisplayAr != "16:9":
-						doForce16 = True
-						scaleOpt = scaleOpt + ",setdar=dar=16/9"
-			else:
-				scaleOpt = ""
-				targVidWidth = bfVideoWidth
-				targVidHeight = bfVideoHeight
-		else:
-			scaleOpt = ""
-			targVidWidth = bfVideoWidth
-			targVidHeight = bfVideoHeight
+		for preset, crf, threads, concurrency in itertools.product(benchPresets, benchCrfs, benchThreads, benchJobs):
 			
-		### Audio wasn't found
-		
-		if not audioFound:
-			audioOpt = "-an"
+			videoTargCodecPreset, videoTargCrf, coresPerJob, jobs = preset, str(crf), threads, concurrency
 			
-		### Fallback audio options
-		
-		if audioFound and not audioReenc and not audioDownmix:
-			audioOpt = "-c:a" + " " + "copy"
-			tagAudio = bfAudioCodecName
-			tagChannels = str(bfAudioChannels)
+			logger.newline()
+			logger.info("-+- Bench: %s | preset: %s | crf: %s | coresPerJob: %s | jobs: %s -+-" % (clipFile, preset, crf, threads if threads > 0 else "auto", concurrency))
+			if dryRun: continue
 			
-		### Audio reencoding
-		
-		doReencAudio = False
-		
-		if audioFound:
-			if audioReenc:
-				if debug : logger.info("** Reencoding audio!")
-				if bfAudioBitrate != 0:
-					if debug : logger.info("** Audio bitrate is non-zero")
-					if bfAudioChannels > 2:
-						if debug : logger.info("** There are more than 2 audio channels")
-						if not audioReencForce:
-							if debug : logger.info("** audioReencForce is NOT enabled")
-							if bfAudioBitrate <= audioReencBitRateSurround:
-								if debug : logger.info("** The input bitrate (%s) is <= the desired bitrate (%s) (surround)" % (bfAudioBitrate, audioReencBitRateSurround))
-								doReencAudio = False
-								audioOpt = "-c:a copy"
-								tagAudio = bfAudioCodecName
-								tagChannels = str(bfAudioChannels)
-							else:
-								if debug : logger.info("** The input bitrate (%s) > than the desired bitrate (%s) (surround)" % (bfAudioBitrate, audioReencBitRateSurround))
-								doReencAudio = True
-								audioOpt = "-c:a" + " " + audioReencCodec + " " + "-b:a" + " " + str(audioReencBitRateSurround) + "k" + " " + "-ac" + " " + str(audioReencChannelsSurround)
-								tagAudio = audioReencCodec
-								tagChannels = str(audioReencChannelsSurround)
-						else:
-							if debug : logger.info("** audioReencForce IS enabled")
-							doReencAudio = True
-							audioOpt = "-c:a" + " " + audioReencCodec + " " + "-b:a" + " " + str(audioReencBitRateSurround) + "k" + " " + "-ac" + " " + str(audioReencChannelsSurround)
-							tagAudio = audioReencCodec
-							tagChannels = str(audioReencChannelsSurround)							
-					else:
-						if debug : logger.info("** There are 2 or less audio channels")
-						if not audioReencForce:
-							if debug : logger.info("** audioReencForce is NOT enabled")
-							if bfAudioBitrate <= audioReencBitRateStereo:
-								if debug : logger.info("** The input bitrate (%s) <= than the desired bitrate (%s) (stereo)" % (bfAudioBitrate, audioReencBitRateStereo))
-								doReencAudio = False
-								audioOpt = "-c:a" + " " + "copy"
-								tagAudio = bfAudioCodecName
-								tagChannels = str(bfAudioChannels)
-							else:
-								if debug : logger.info("** The input bitrate (%s) is > the desired bitrate (%s) (stereo)" % (bfAudioBitrate, audioReencBitRateStereo))
-								doReencAudio = True
-								audioOpt = "-c:a" + " " + audioReencCodec + " " + "-b:a" + " " + str(audioReencBitRateStereo) + "k"
-								tagAudio = audioReencCodec
-								tagChannels = str(bfAudioChannels)
-						else:
-							if debug : logger.info("** audioReencForce IS enabled")
-							doReencAudio = True
-							audioOpt = "-c:a" + " " + audioReencCodec + " " + "-b:a" + " " + str(audioReencBitRateStereo) + "k"
-							tagAudio = audioReencCodec
-							tagChannels = str(bfAudioChannels)
-				else:
-					if debug : logger.info("** The input bitrate is 0/unknown")
-					doReencAudio = False
-					audioOpt = "-c:a" + " " + "copy"
-					tagAudio = bfAudioCodecName
-					tagChannels = str(bfAudioChannels)
+			benchLog = JobLog(os.path.join(clipFolder, clipFile))
+			job = prepare_job(benchLog, clipFolder, clipFile)
+			if job is None:
+				benchLog.flush()
+				continue
 			
-		### Force reencode of TrueHD audio (if reencoding is enabled)
+			copies = []
+			for copyNum in range(concurrency):
+				copyJob = dict(job)
+				copyJob["encodeArgs"] = job["encodeArgs"][:-1] + [os.path.join(outFolder, "%s-%s" % (copyNum, os.path.basename(job["finalDest"])))]
+				copies.append(copyJob)
+			logger.info("!! exec: %s" % format_cmd(copies[0]["encodeArgs"]))
 			
-		if audioFound:
-			if audioReenc:
-				if bfAudioCodecName == "truehd":
-					doReencAudio = True
-					audioOpt = "-c:a" + " " + audioReencCodec + " " + "-b:a" + " " + str(audioReencBitRateSurround) + "k" + " " + "-ac" + " " + str(audioReencChannelsSurround)
-					tagAudio = audioReencCodec
-					tagChannels = audioReencChannelsSurround
-				
-		### Audio downmixing
-		
-		doDownmix = False
+			benchStart = time.time()
+			with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as benchPool:
+				benchReturnCodes = list(benchPool.map(lambda copyJob: run_ffmpeg(copyJob, copyJob["encodeArgs"]), copies))
+			wallTime = time.time() - benchStart
 			
-		if audioDownmix:
-			if bfAudioChannels <= audioDownmixChannels:
-				doDownmix = False
-				audioOpt = "-c:a" + " " + "copy"
-				tagAudio = bfAudioCodecName
-				tagChannels = str(bfAudioChannels)
-			else:
-				doDownmix = True
-				audioOpt = "-c:a" + " " + audioDownmixCodec + " " + "-b:a" + " " + str(audioDownmixBitRate) + "k" + " " + "-ac" + " " + str(audioDownmixChannels)
-				tagAudio = audioDownmixCodec
-				tagChannels = str(audioDownmixChannels)
-		
-		### Construct destination filename/path
+			if any(code != 0 for code in benchReturnCodes):
+				logger.info("!! ffmpeg failed, skipping...")
+				continue
 			
-		if targVidWidth == 1920:
-			tagRes = "1080p"
-		elif targVidHeight == 1280:
-			tagRes = "720p"
-		else:
-			tagRes = str(bfVideoHeight) + "p"
+			frames = duration * benchRate
+			cpuSeconds = sum(copyJob["rusage"][0] + copyJob["rusage"][1] for copyJob in copies)
+			outputBytes = os.stat(copies[0]["encodeArgs"][-1]).st_size
+			for copyJob in copies:
+				os.remove(copyJob["encodeArgs"][-1])
 			
-		if videoTargCodec == "libx265":
-			tagCodec = "HEVC"
-			tagEncoder = "x265"
-		elif videoTargCodec == "libx264":
-			tagCodec = "AVC"
-			tagEncoder = "x264"
-		else:
-			tagCodec = "tagCodec"
-			tagEncoder = "tagEncoder"
-		
-		tagChannels = str(tagChannels) + "ch"
+			result = {
+				"clip": clipFile, "source": source, "size": size, "duration": duration,
+				"preset": preset, "crf": str(crf), "coresPerJob": threads, "jobs": concurrency,
+				"wallTime": round(wallTime, 2),
+				"fpsPerJob": round(frames / wallTime, 2),
+				"fpsTotal": round(frames * concurrency / wallTime, 2),
+				"cpuSeconds": round(cpuSeconds, 2),
+				"cpuUtil": round(cpuSeconds / (wallTime * cpuCount) * 100, 1),
+				"framesPerCpuSecond": round(frames * concurrency / cpuSeconds, 2) if cpuSeconds > 0 else None,
+				"outputMB": round(outputBytes / 1000000, 2),
+				"kbps": round(outputBytes * 8 / duration / 1000, 1),
+			}
+			results.append(result)
+			logger.info(":: fps: %s per job / %s total | cpu: %s%% of %s cores | %s frames/cpu-sec | %s MB (%s kb/s)" % (result["fpsPerJob"], result["fpsTotal"], result["cpuUtil"], cpuCount, result["framesPerCpuSecond"], result["outputMB"], result["kbps"]))
+			with open(benchPath, "a") as benchOut:
+				benchOut.write(json.dumps(result) + "\n")
+	
+	### Report the fastest config per clip, with output size for judging what's acceptable
+	
+	if results:
+		logger.newline()
+		logger.info(":: Bench Summary (fastest total fps per clip)")
+		for clipFile in sorted(set(result["clip"] for result in results)):
+			clipResults = sorted((result for result in results if result["clip"] == clipFile), key=lambda result: -result["fpsTotal"])
+			for result in clipResults:
+				logger.info("\t %s | preset: %s | crf: %s | coresPerJob: %s | jobs: %s | %s fps | %s%% cpu | %s MB" % (clipFile, result["preset"], result["crf"], result["coresPerJob"], result["jobs"], result["fpsTotal"], result["cpuUtil"], result["outputMB"]))
+		logger.info("\t Results: %s" % benchPath)
+
+### Load past runs from metricsFile, grouped by (sourceCodec, targetRes, preset) with coarser
+### fallback groups, each holding media seconds, pixel-seconds, cpu seconds, wall time and sizes
+
+def load_history():
+	
+	history = {}
+	if metricsFile == "" or not os.path.isfile(metricsPath): return history
+	
+	with open(metricsPath) as metricsIn:
+		for line in metricsIn:
+			try:
+				record = json.loads(line)
+			except ValueError:
+				continue
+			if record.get("status") != "done" or not record.get("duration") or not record.get("wallTime"): continue
+			width, height = (int(n) for n in record["targetRes"].split("x"))
+			for groupKey in ((record["sourceCodec"], record["targetRes"], record["preset"]), (record["targetRes"], record["preset"]), (record["preset"],), ()):
+				group = history.setdefault(groupKey, {"count": 0, "duration": 0.0, "pixelSeconds": 0.0, "cpuSeconds": 0.0, "wallTime": 0.0, "inputBytes": 0, "outputBytes": 0})
+				group["count"] += 1
+				group["duration"] += record["duration"]
+				group["pixelSeconds"] += width * height * record["duration"]
+				group["cpuSeconds"] += record["cpuUser"] + record["cpuSys"]
+				group["wallTime"] += record["wallTime"]
+				group["inputBytes"] += record["inputBytes"]
+				group["outputBytes"] += record["outputBytes"]
+	
+	return history
+
+### Closest history group for a job, None without any history
+
+def history_group(history, job):
+	
+	for groupKey in ((job["sourceCodec"], job["targetRes"], job["preset"]), (job["targetRes"], job["preset"]), (job["preset"],), ()):
+		if groupKey in history: return history[groupKey]
+	return None
+
+### Without history, output size is guessed from the source codec (scaled by the share of pixels kept) and
+### cpu time from target pixel-seconds at roughly x265 medium speed
+
+codecSizeGuess = {"hevc": 0.85, "av1": 0.95, "vp9": 0.85, "h264": 0.55}
+cpuPerPixelSecondGuess = 0.000005
+
+### Estimate a job's output bytes and cpu seconds, from the closest history group if there is one
+
+def estimate_job(job, history):
+	
+	width, height = (int(n) for n in job["targetRes"].split("x"))
+	sourceWidth, sourceHeight = (int(n) for n in job["sourceRes"].split("x"))
+	pixelSeconds = width * height * job["inputDuration"]
+	
+	group = history_group(history, job)
+	if group is not None:
+		return job["inputBytes"] * group["outputBytes"] / max(1, group["inputBytes"]), pixelSeconds * group["cpuSeconds"] / group["pixelSeconds"]
+	
+	sizeRatio = codecSizeGuess.get(job["sourceCodec"], 0.4) * min(1.0, width * height / max(1, sourceWidth * sourceHeight))
+	return job["inputBytes"] * sizeRatio, pixelSeconds * cpuPerPixelSecondGuess
+
+### Finish time of jobs with these costs, each started on whichever of the slots frees up first
+
+def makespan(costs, slots):
+	
+	finish = [0.0] * max(1, slots)
+	for cost in costs:
+		heapq.heapreplace(finish, finish[0] + cost)
+	return max(finish)
+
+### Predict the cost of every planned job from the closest matching history group and report
+### totals per target resolution, predicted cpu-hours, wall-clock time at the configured jobs and output size
+
+def capacity_report(plannedJobs):
+	
+	history = load_history()
+	perRes = {}
+	totals = {"files": 0, "duration": 0.0, "inputBytes": 0, "cpuSeconds": 0.0, "outputBytes": 0.0, "predicted": 0}
+	jobWalls = []
+	
+	for job in plannedJobs:
 		
-		if tagAudio == "libopus": tagAudio = "OPUS"
-		if tagAudio == "libvorbis": tagAudio = "OGG"
-		if tagAudio == "vorbis": tagAudio = "OGG"
-		if tagAudio == "libfdk_aac": tagAudio = "AAC"
-		if tagAudio == "libmp3lame": tagAudio = "MP3"
-		if tagAudio == "libtwolame": tagAudio = "MP2"
-		if tagAudio == "mp2": tagAudio = "MP2"
-		if tagAudio == "wmav2": tagAudio = "WMA"
-		if tagAudio == "wmav1": tagAudio = "WMA"
+		width, height = (int(n) for n in job["targetRes"].split("x"))
+		pixelSeconds = width * height * job["inputDuration"]
 		
-		tagAudio = tagAudio.upper()
+		res = perRes.setdefault(job["targetRes"], {"files": 0, "duration": 0.0, "pixelSeconds": 0.0, "inputBytes": 0})
+		res["files"] += 1
+		res["duration"] += job["inputDuration"]
+		res["pixelSeconds"] += pixelSeconds
+		res["inputBytes"] += job["inputBytes"]
 		
-		newName = inputBaseFile + "." + tagRes + "." + tagCodec + "." + tagEncoder + "." + tagChannels + "." + tagAudio + fileTag + ".mkv"
+		totals["files"] += 1
+		totals["duration"] += job["inputDuration"]
+		totals["inputBytes"] += job["inputBytes"]
 		
-		anPattern = re.compile('[^a-zA-Z0-9_.-]')
-		newName = anPattern.sub('', newName)
+		group = history_group(history, job)
+		if group is None: continue
 		
-		if destDir == "":
-			finalDest = os.path.join(root, newName)
-		else:
-			finalDest = os.path.join(destDir, newName)
-			
-		if debug:
-			logger.newline()
-			logger.info('** Filename Construction')
-			logger.info(inputAbsPath)
-			logger.info(inputPath)
-			logger.info(inputFile)
-			logger.info(inputBaseFile)
-			logger.info(finalDest)
-			
-			
-		### Pre-encode data summary
+		### cpu scales with pixel-seconds, wall time with media seconds, output size with input size
 		
-		if tagCodec != "tagCodec" and tagEncoder != "tagEncoder":
-			outputVidFormat = tagCodec + " / " + tagEncoder
-		else:
-			outputVidFormat = videoTargCodec
-			
-		if doDownscale:
-			outputVidWidth = maxVidWidth
-			outputVidHeight = maxVidHeight
-		else:
-			outputVidWidth = bfVideoWidth
-			outputVidHeight = bfVideoHeight
-			
-		if doForce16:
-			outputVidAr = "16:9"
-		else:
-			outputVidAr = bfVideoDisplayAr
-			
-		if audioOpt == "-c:a copy":
-			outputAudCodec = bfAudioCodecName
-			outputAudBit = bfAudioBitrateDisplay
-			outputAudChannels = bfAudioChannelsDisplay
-		else:
-			if doReencAudio:
-				if bfAudioChannels > 2:
-					outputAudCodec = audioReencCodec
-					outputAudBit = str(audioReencBitRateSurround)
-					outputAudChannels = str(audioReencChannelsSurround)
-				else:
-					outputAudCodec = audioReencCodec
-					outputAudBit = str(audioReencBitRateStereo)
-					outputAudChannels = bfAudioChannelsDisplay
-			if doDownmix:
-				outputAudCodec = audioDownmixCodec
-				outputAudBit = str(audioDownmixBitRate)
-				outputAudChannels = str(audioDownmixChannels)
+		jobWall = job["inputDuration"] * group["wallTime"] / group["duration"]
+		totals["predicted"] += 1
+		totals["cpuSeconds"] += pixelSeconds * group["cpuSeconds"] / group["pixelSeconds"]
+		jobWalls.append(jobWall)
+		totals["outputBytes"] += job["inputBytes"] * group["outputBytes"] / group["inputBytes"]
+	
+	logger.newline()
+	logger.info(":: Capacity Plan")
+	logger.info("\t Files to encode: %s | Input: %s GB | Duration: %s hours" % (totals["files"], round(totals["inputBytes"] / 1000000000, 2), round(totals["duration"] / 3600, 2)))
+	for targetRes in sorted(perRes):
+		res = perRes[targetRes]
+		logger.info("\t %s: %s files | %s hours | %s Gpixel-sec | %s GB" % (targetRes, res["files"], round(res["duration"] / 3600, 2), round(res["pixelSeconds"] / 1000000000, 1), round(res["inputBytes"] / 1000000000, 2)))
+	logger.newline()
+	
+	if totals["predicted"] == 0:
+		logger.info("!! No encode history in %s to predict from, run some encodes first" % metricsFile)
+		return
+	
+	### Past runs' wall times already reflect the concurrency they ran at, so lay the jobs out on jobs slots,
+	### in walk order and longest first
+	
+	wallClock = makespan(jobWalls, jobs)
+	wallClockLpt = makespan(sorted(jobWalls, reverse=True), jobs)
+	logger.info("\t Predicted from %s past encodes (%s of %s files matched)" % (history[()]["count"], totals["predicted"], totals["files"]))
+	logger.info("\t CPU: %s hours" % round(totals["cpuSeconds"] / 3600, 1))
+	logger.info("\t Wall-clock @ %s jobs: %s hours (%s hours with schedulePolicy \"lpt\")" % (jobs, round(wallClock / 3600, 1), round(wallClockLpt / 3600, 1)))
+	logger.info("\t Output: %s GB (saves %s GB)" % (round(totals["outputBytes"] / 1000000000, 2), round((totals["inputBytes"] - totals["outputBytes"]) / 1000000000, 2)))
+
+### Format seconds as an ETA
+
+def format_eta(seconds):
+	
+	if seconds is None: return "unknown"
+	return str(datetime.timedelta(seconds=int(seconds)))
+
+### Log fps, speed, size and ETA for each running encode, plus an ETA for the next jobs (running encodes and
+### planned jobs waiting on an encoder, not files the walk hasn't probed yet), every progressInterval seconds
+
+def progress_reporter():
+	
+	while not progressStop.wait(progressInterval):
+		with progressLock:
+			snapshot = [(job, list(job["progress"].values())) for job in runningJobs.values()]
+			queuedDuration = max(0.0, progressTotals["queuedDuration"])
+			queuedCount = max(0, progressTotals["queuedCount"])
+		if not snapshot: continue
 		
-		prefAudioFormatsList = ' '.join(prefAudioFormats)
+		lines = []
+		batchRemaining = queuedDuration
+		batchSpeed = 0.0
+		for job, progress in snapshot:
+			outTime = sum(p[0] for p in progress)
+			fps = sum(p[1] for p in progress)
+			speed = sum(p[2] for p in progress)
+			outputSize = sum(p[3] for p in progress) / 1000000
+			remaining = max(0.0, job["inputDuration"] - outTime)
+			batchRemaining += remaining
+			batchSpeed += speed
+			if job["inputDuration"] > 0:
+				percent = str(round(min(100.0, outTime / job["inputDuration"] * 100), 1)) + "%"
+			else:
+				percent = "?"
+			lines.append("~~ %s: %s | fps: %s | speed: %sx | %s MB | ETA: %s" % (job["inputFile"], percent, round(fps, 1), round(speed, 2), round(outputSize, 2), format_eta(remaining / speed if speed > 0 else None)))
+		lines.append("~~ Next %s jobs: %s running, %s queued | ETA: %s" % (len(snapshot) + queuedCount, len(snapshot), queuedCount, format_eta(batchRemaining / batchSpeed if batchSpeed > 0 else None)))
 		
-		if subOpt == "":
-			outputSubtitleCodec = "ass"
+		with logLock:
+			for line in lines:
+				logger.info(line)
+
+### Pick segment boundaries for a long input, on chapter starts if there are chapters, otherwise
+### every segmentLength seconds.  Segments shorter than segmentLength are folded into their neighbour.
+
+def split_segments(chapters, inputDuration):
+	
+	points = [0.0]
+	
+	if chapters:
+		for chapterStart in chapters:
+			if chapterStart - points[-1] >= segmentLength and inputDuration - chapterStart >= segmentLength:
+				points.append(chapterStart)
+	else:
+		segStart = float(segmentLength)
+		while inputDuration - segStart >= segmentLength:
+			points.append(segStart)
+			segStart += segmentLength
+	
+	points.append(inputDuration)
+	return [(points[i], points[i + 1]) for i in range(len(points) - 1)]
+
+### Encode a job's video segments segmentJobs at a time and list them for the concat demuxer
+
+def encode_segment_video(job):
+	
+	segmentDir = job["segmentDir"]
+	os.makedirs(segmentDir, exist_ok=True)
+	
+	with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, segmentJobs)) as segmentPool:
+		segReturnCodes = list(segmentPool.map(lambda segNum: run_ffmpeg(job, job["segmentArgs"][segNum], "", segNum), range(len(job["segmentArgs"]))))
+	
+	ffReturnCode = next((code for code in segReturnCodes if code != 0), 0)
+	
+	if ffReturnCode == 0:
+		with open(os.path.join(segmentDir, "segments.txt"), "w") as segmentList:
+			for segNum in range(len(job["segmentArgs"])):
+				segmentList.write("file 'seg%04d.mkv'\n" % segNum)
+	else:
+		job["log"].info("!! Segment encode failed!")
+	
+	return ffReturnCode
+
+### Encode a job's video segments, then join them and mux in audio/subtitles
+
+def encode_segments(job):
+	
+	ffReturnCode = encode_segment_video(job)
+	if ffReturnCode == 0: ffReturnCode = run_ffmpeg(job, job["muxArgs"], job["reportEnv"])
+	shutil.rmtree(job["segmentDir"], ignore_errors=True)
+	return ffReturnCode
+
+### Extract & transcode one audio/subtitle stream into the stream cache, it only gets its cache name once whole
+
+def extract_stream(job, streamFile, args):
+	
+	ffReturnCode = run_ffmpeg(job, args)
+	if ffReturnCode == 0:
+		os.replace(streamFile + ".part", streamFile)
+	elif os.path.isfile(streamFile + ".part"):
+		os.remove(streamFile + ".part")
+	return ffReturnCode
+
+### Stream pipeline: audio/subtitles are extracted (or reused from the stream cache) while the video is encoded
+### (whole or in segments), then everything is muxed with -c copy.  The cache is only cleared once the mux
+### succeeds, so a retry after a failed video encode redoes the video alone.
+
+def encode_streams(job):
+	
+	logger = job["log"]
+	os.makedirs(job["streamDir"], exist_ok=True)
+	
+	with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(job["streamArgs"]))) as streamPool:
+		streamFutures = []
+		for streamFile, args in job["streamArgs"]:
+			if os.path.isfile(streamFile):
+				logger.info("++ Reusing cached stream: %s" % os.path.basename(streamFile))
+			else:
+				streamFutures.append(streamPool.submit(extract_stream, job, streamFile, args))
+		if job["segmentArgs"]:
+			ffReturnCode = encode_segment_video(job)
 		else:
-			outputSubtitleCodec = bfSubtitleCodecName
-		
-		logger.newline()
-		logger.info("-+- Input -+-")
+			ffReturnCode = run_ffmpeg(job, job["videoArgs"], job["reportEnv"], "encode")
+		streamReturnCodes = [streamFuture.result() for streamFuture in streamFutures]
+	
+	if any(code != 0 for code in streamReturnCodes):
+		logger.info("!! Audio/subtitle extract failed!")
+		ffReturnCode = ffReturnCode or next(code for code in streamReturnCodes if code != 0)
+	
+	if ffReturnCode == 0:
+		ffReturnCode = run_ffmpeg(job, job["muxArgs"], job["reportEnv"] if job["segmentArgs"] else "")
+	
+	if ffReturnCode == 0:
+		shutil.rmtree(job["streamDir"], ignore_errors=True)
+	if job["segmentArgs"]:
+		shutil.rmtree(job["segmentDir"], ignore_errors=True)
+	elif os.path.isfile(job["videoArgs"][-1]):
+		os.remove(job["videoArgs"][-1])
+	return ffReturnCode
+
+### Encode a set of sample pieces all at once, returns their total size in bytes (None if one failed)
+
+def encode_samples(job, samplesArgs):
+	
+	sampleDir = job["sampleDir"]
+	os.makedirs(sampleDir, exist_ok=True)
+	
+	with concurrent.futures.ThreadPoolExecutor(max_workers=len(samplesArgs)) as samplePool:
+		sampleReturnCodes = list(samplePool.map(lambda sampleArgs: run_ffmpeg(job, sampleArgs), samplesArgs))
+	
+	sampleBytes = None
+	if all(code == 0 for code in sampleReturnCodes):
+		sampleBytes = sum(os.path.getsize(sampleArgs[-1]) for sampleArgs in samplesArgs)
+	
+	shutil.rmtree(sampleDir, ignore_errors=True)
+	return sampleBytes
+
+### Encode a job's samples and extrapolate their size (bytes per second) to the whole input.
+### Returns the predicted savings in percent, or None if a sample failed.
+
+def sample_encode(job):
+	
+	sampleBytes = encode_samples(job, job["sampleArgs"])
+	if sampleBytes is None: return None
+	predictedBytes = sampleBytes / (len(job["sampleArgs"]) * sampleLength) * job["inputDuration"]
+	return round(100 - (predictedBytes / job["inputBytes"] * 100), 2)
+
+### Copy of an ffmpeg argv with its -crf value replaced
+
+def with_crf(args, crf):
+	
+	args = list(args)
+	args[args.index('-crf') + 1] = crf
+	return args
+
+### Pick a job's CRF: the lowest in autoCrfRange whose video-only samples stay within the target bitrate,
+### found by binary search.  Results are kept per folder (series/season), so sibling episodes reuse them;
+### a sibling arriving mid-search waits for it.  Returns None if the job can't be tuned.
+
+def tune_crf(job):
+	
+	logger = job["log"]
+	tuneKey = (os.path.dirname(job["inputAbsPath"]), job["targetRes"], job["videoCodec"], job["preset"], job["targetBitRate"])
+	with crfLocksLock:
+		tuneLock = crfLocks.setdefault(tuneKey, threading.Lock())
+	
+	with tuneLock:
+		
+		with dbLock:
+			row = stateDb.execute("SELECT crf FROM crfTuning WHERE folder=? AND targetRes=? AND codec=? AND preset=? AND bitRate=?", tuneKey).fetchone()
+		if row is not None:
+			logger.info("++ Auto CRF: %s (tuned earlier for this folder @ %s kb/s)" % (row[0], job["targetBitRate"]))
+			log_event("crf", job["inputAbsPath"], crf=row[0], targetBitRate=job["targetBitRate"], reused=True)
+			return row[0]
+		if not job["tuneArgs"]: return None
+		
+		lowCrf, highCrf = autoCrfRange
+		while lowCrf < highCrf:
+			midCrf = (lowCrf + highCrf) // 2
+			sampleBytes = encode_samples(job, [with_crf(args, str(midCrf)) for args in job["tuneArgs"]])
+			if sampleBytes is None:
+				logger.info("!! Auto CRF sample encode failed!")
+				return None
+			sampleBitRate = sampleBytes * 8 / 1000 / (len(job["tuneArgs"]) * sampleLength)
+			logger.info("\t crf %s: %s kb/s" % (midCrf, round(sampleBitRate)))
+			if sampleBitRate <= job["targetBitRate"]:
+				highCrf = midCrf
+			else:
+				lowCrf = midCrf + 1
+		
+		logger.info("++ Auto CRF: %s (target %s kb/s)" % (lowCrf, job["targetBitRate"]))
+		log_event("crf", job["inputAbsPath"], crf=str(lowCrf), targetBitRate=job["targetBitRate"], reused=False)
+		with dbLock:
+			stateDb.execute("INSERT OR REPLACE INTO crfTuning VALUES (?, ?, ?, ?, ?, ?, ?)", tuneKey + (str(lowCrf), time.time()))
+			stateDb.commit()
+		return str(lowCrf)
+
+### Write a planned job into the shared queue (queueDir/pending), unless it's already queued,
+### running or done.  The job id is its plan hash, so replanning the same input is a no-op.
+
+def queue_submit(job):
+	
+	jobId = job["planHash"]
+	with queuedLock:
+		if jobId in queuedIds:
+			job["log"].info("-- Already queued, running or done: %s" % jobId)
+			return
+		queuedIds.add(jobId)
+	
+	queuedJob = {key: value for key, value in job.items() if key != "log"}
+	queuedJob["logLines"] = job["log"].lines
+	tmpPath = os.path.join(queueDir, "pending", "." + jobId + ".tmp")
+	with open(tmpPath, "w") as jobFile:
+		json.dump(queuedJob, jobFile)
+	os.rename(tmpPath, os.path.join(queueDir, "pending", jobId + ".json"))
+	job["log"].info("++ Queued: %s" % jobId)
+
+### Claim the next pending job by renaming it into queueDir/running (atomic on a shared filesystem,
+### only one worker can win).  Returns (claimed path, job) or (None, None) if nothing is pending.
+
+def queue_claim():
+	
+	pendingDir = os.path.join(queueDir, "pending")
+	for queuedFile in sorted(os.listdir(pendingDir)):
+		if queuedFile.startswith(".") or not queuedFile.endswith(".json"): continue
+		jobId = queuedFile[:-len(".json")]
+		claimedPath = os.path.join(queueDir, "running", jobId + "@" + workerId + ".json")
+		try:
+			os.rename(os.path.join(pendingDir, queuedFile), claimedPath)
+		except FileNotFoundError:
+			continue
+		
+		### The rename keeps the coordinator's mtime, so touch the claim before a stale sweep sees it
+		
+		with claimedLock:
+			claimedPaths.add(claimedPath)
+		try:
+			os.utime(claimedPath)
+			with open(claimedPath) as jobFile:
+				job = json.load(jobFile)
+		except FileNotFoundError:
+			with claimedLock:
+				claimedPaths.discard(claimedPath)
+			continue
+		job["log"] = JobLog(job["inputAbsPath"])
+		job["log"].lines = job.pop("logLines")
+		return claimedPath, job
+	return None, None
+
+### Move a claimed job to queueDir/done or queueDir/failed
+
+def queue_finish(claimedPath, state):
+	
+	with claimedLock:
+		claimedPaths.discard(claimedPath)
+	jobId = os.path.basename(claimedPath).split("@")[0]
+	try:
+		os.rename(claimedPath, os.path.join(queueDir, state, jobId + ".json"))
+	except FileNotFoundError:
+		with logLock:
+			logger.info("-- Lost claim on %s (released as stale), result not recorded" % jobId)
+
+### Put jobs back in queueDir/pending if their worker stopped heartbeating (died or lost the share)
+
+def queue_release_stale():
+	
+	runningDir = os.path.join(queueDir, "running")
+	for claimedFile in os.listdir(runningDir):
+		claimedPath = os.path.join(runningDir, claimedFile)
+		try:
+			if time.time() - os.stat(claimedPath).st_mtime < queueStaleAfter: continue
+			os.rename(claimedPath, os.path.join(queueDir, "pending", claimedFile.split("@")[0] + ".json"))
+		except FileNotFoundError:
+			continue
+		with logLock:
+			logger.info("-- Released stale job: %s" % claimedFile)
+
+### Touch every job this worker holds so other hosts know it's still alive
+
+def queue_heartbeat():
+	
+	while not heartbeatStop.wait(queueHeartbeat):
+		with claimedLock:
+			heldPaths = list(claimedPaths)
+		for claimedPath in heldPaths:
+			try:
+				os.utime(claimedPath)
+			except FileNotFoundError:
+				pass
+
+### Queue worker thread, claims and encodes jobs until the coordinator is done and the queue is empty
+
+def queue_worker():
+	
+	while not stopEvent.is_set():
+		queue_release_stale()
+		encodeGovernor.acquire()
+		claimedPath, job = queue_claim()
+		if job is None:
+			encodeGovernor.release()
+			if os.path.isfile(os.path.join(queueDir, "complete")) and not os.listdir(os.path.join(queueDir, "running")):
+				break
+			time.sleep(queuePoll)
+			continue
+		try:
+			encode_job(job)
+			if "offload" in job:
+				job["offload"].add_done_callback(lambda future, claimedPath=claimedPath, job=job: queue_finish(claimedPath, "failed" if job.get("failed") else "done"))
+			elif job.get("failed"):
+				queue_finish(claimedPath, "failed")
+			else:
+				queue_finish(claimedPath, "done")
+		except Exception as encodeExc:
+			job["log"].info("!! Encode crashed: %s" % repr(encodeExc))
+			queue_finish(claimedPath, "failed")
+		finally:
+			encodeGovernor.release()
+			if "offload" not in job: job["log"].flush()
+
+### Compact record of one ffprobe stream, extracted once per probe
+
+class StreamRecord:
+	
+	__slots__ = ("index", "codecType", "codecName", "language", "channels", "channelsDisplay", "bitRate", "bitRateDisplay", "width", "height", "displayAr")
+	
+	def __init__(self, i):
+		
+		self.codecType = i["codec_type"]
+		self.index = i.get("index", "unknown")
+		self.codecName = i.get("codec_name", "unknown")
+		self.language = i.get("tags", {}).get("language", "unknown")
+		self.width = i.get("width", "unknown")
+		self.height = i.get("height", "unknown")
+		self.displayAr = i.get("display_aspect_ratio", "unknown")
+		
+		if 'channels' in i:
+			self.channels = int(i["channels"])
+			self.channelsDisplay = self.channels
+		else:
+			self.channels = 0
+			self.channelsDisplay = "unknown"
+		
+		### Audio bitrate isn't always reported, fill in what we know for DTS-HD MA & TrueHD
+		
+		if 'bit_rate' in i:
+			self.bitRate = int(int(i["bit_rate"]) / 1000)
+			self.bitRateDisplay = self.bitRate
+		elif self.codecType == "audio" and self.codecName == "dts" and i.get("profile") == "DTS-HD MA":
+			self.codecName = "dts-hd ma"
+			self.bitRate = 1536
+			self.bitRateDisplay = str(self.bitRate)
+		elif self.codecType == "audio" and self.codecName == "truehd":
+			self.bitRate = 18000
+			self.bitRateDisplay = str(self.bitRate) + " (max)"
+		else:
+			self.bitRate = 0
+			self.bitRateDisplay = "unknown"
+
+### Normalized probe: overall info plus stream records grouped by type
+
+class ProbeInfo:
+	
+	__slots__ = ("path", "size", "bitRate", "duration", "chapters", "streamCount", "video", "audio", "subtitle")
+
+def normalize_probe(data, inputAbsPath, inputBytes):
+	
+	probe = ProbeInfo()
+	probe.path = inputAbsPath
+	probe.size = inputBytes
+	
+	if "bit_rate" in data["format"]:
+		probe.bitRate = str(round(int(data["format"]["bit_rate"]) / 1000, 2))
+	else:
+		probe.bitRate = "unknown"
+	
+	if "duration" in data["format"]:
+		probe.duration = float(data["format"]["duration"])
+	else:
+		probe.duration = 0
+	
+	probe.chapters = [float(chapter["start_time"]) for chapter in data.get("chapters", [])]
+	probe.streamCount = len(data["streams"])
+	probe.video, probe.audio, probe.subtitle = [], [], []
+	
+	for i in data["streams"]:
+		if i.get("codec_type") in ("video", "audio", "subtitle"):
+			getattr(probe, i["codec_type"]).append(StreamRecord(i))
+	
+	return probe
+
+### Everything decided about an input before encoding: chosen tracks, ffmpeg options and destination
+
+class EncodePlan:
+	
+	__slots__ = ("video", "audio", "subtitle", "vidMap", "audioMap", "subMap", "audioTag", "subTag", "scaleOpt", "audioOpt", "subOpt", "codec", "preset", "crf", "doDownscale", "doForce16", "doReencAudio", "doDownmix", "targVidWidth", "targVidHeight", "outputVidFormat", "outputVidAr", "outputAudCodec", "outputAudBit", "outputAudChannels", "outputSubtitleCodec", "newName", "finalDest", "debug")
+
+### Config values plan() depends on, overrides are applied on top (e.g. a tuned crf)
+
+planConfigNames = ["targLang", "prefAudioFormats", "videoTargCodec", "videoTargCodecPreset", "videoTargCrf", "videoDownscale", "maxVidWidth", "maxVidHeight", "force16", "audioReenc", "audioReencForce", "audioReencCodec", "audioReencBitRateStereo", "audioReencBitRateSurround", "audioReencChannelsSurround", "audioDownmix", "audioDownmixCodec", "audioDownmixChannels", "audioDownmixBitRate", "fileTag", "destDir"]
+
+def plan_config(**overrides):
+	
+	config = types.SimpleNamespace(**{name: globals()[name] for name in planConfigNames})
+	config.__dict__.update(overrides)
+	return config
+
+### First prefAudioFormats pass an audio stream qualifies for (None if it never does).  A format
+### pass takes targLang streams in that codec, a blank pass takes any stream.
+
+def audio_pass(stream, config):
+	
+	for passIndex, audioFormat in enumerate(config.prefAudioFormats):
+		if audioFormat == "" or (stream.language == config.targLang and stream.codecName == audioFormat):
+			return passIndex
+	return None
+
+### Plan an input from its normalized probe.  Pure, so plans can be unit tested, made in bulk and
+### shipped to other workers.
+###
+### Audio: a lone track is always chosen.  Otherwise the most channels wins among tracks that
+### qualify for a prefAudioFormats pass, ties going to the earlier pass, then the earlier track
+### (the same pick the old pass-by-pass deep search made, in a single scoring pass).
+
+def plan(probe, config):
+	
+	encodePlan = EncodePlan()
+	encodePlan.debug = []
+	encodePlan.codec = config.videoTargCodec
+	encodePlan.preset = config.videoTargCodecPreset
+	encodePlan.crf = config.videoTargCrf
+	
+	### Video, first track
+	
+	video = probe.video[0] if probe.video else None
+	encodePlan.video = video
+	if video is None: return encodePlan
+	
+	### Audio, one scoring pass
+	
+	audio = None
+	if len(probe.audio) == 1:
+		audio = probe.audio[0]
+	elif len(probe.audio) > 1:
+		bestKey = None
+		for order, stream in enumerate(probe.audio):
+			passIndex = audio_pass(stream, config)
+			if passIndex is None or stream.channels <= 0: continue
+			key = (stream.channels, -passIndex, -order)
+			encodePlan.debug.append("** index: %s | pass: %s (%s) | channels: %s" % (stream.index, passIndex, config.prefAudioFormats[passIndex], stream.channels))
+			if bestKey is None or key > bestKey:
+				bestKey = key
+				audio = stream
+	encodePlan.audio = audio
+	
+	### Subtitle, first targLang track
+	
+	subtitle = None
+	for stream in probe.subtitle:
+		if stream.language == config.targLang:
+			subtitle = stream
+			break
+	encodePlan.subtitle = subtitle
+	
+	### Track maps & language tags
+	
+	encodePlan.vidMap = "-map 0:" + str(video.index)
+	encodePlan.audioMap = ""
+	encodePlan.audioTag = ""
+	encodePlan.subMap = ""
+	encodePlan.subTag = ""
+	encodePlan.subOpt = ""
+	encodePlan.outputSubtitleCodec = ""
+	
+	if audio is not None:
+		encodePlan.audioMap = "-map 0:" + str(audio.index)
+		if audio.language != "unknown":
+			encodePlan.audioTag = "-metadata:s:1 language=" + audio.language
+	
+	if subtitle is not None:
+		encodePlan.subMap = "-map 0:" + str(subtitle.index)
+		encodePlan.subTag = "-metadata:s:2 language=" + subtitle.language
+		if subtitle.codecName == "hdmv_pgs_subtitle" or subtitle.codecName == "dvd_subtitle":
+			encodePlan.subOpt = "-c:s copy"
+			encodePlan.outputSubtitleCodec = subtitle.codecName
+		else:
+			encodePlan.outputSubtitleCodec = "ass"
+	
+	### Video downscaling
+	
+	encodePlan.doDownscale = False
+	encodePlan.doForce16 = False
+	encodePlan.scaleOpt = ""
+	encodePlan.targVidWidth = video.width
+	encodePlan.targVidHeight = video.height
+	encodePlan.outputVidAr = video.displayAr
+	
+	if config.videoDownscale and (video.width > config.maxVidWidth or video.height > config.maxVidHeight):
+		encodePlan.doDownscale = True
+		encodePlan.scaleOpt = "-vf scale=" + str(config.maxVidWidth) + ":" + str(config.maxVidHeight)
+		encodePlan.targVidWidth = config.maxVidWidth
+		encodePlan.targVidHeight = config.maxVidHeight
+		if config.force16 and video.displayAr != "16:9":
+			encodePlan.doForce16 = True
+			encodePlan.scaleOpt = encodePlan.scaleOpt + ",setdar=dar=16/9"
+			encodePlan.outputVidAr = "16:9"
+	
+	### Audio options
+	
+	encodePlan.doReencAudio = False
+	encodePlan.doDownmix = False
+	surroundOpt = "-c:a " + config.audioReencCodec + " -b:a " + str(config.audioReencBitRateSurround) + "k -ac " + str(config.audioReencChannelsSurround)
+	stereoOpt = "-c:a " + config.audioReencCodec + " -b:a " + str(config.audioReencBitRateStereo) + "k"
+	
+	if audio is None:
+		encodePlan.audioOpt = "-an"
+	else:
+		encodePlan.audioOpt = "-c:a copy"
+		tagAudio = audio.codecName
+		tagChannels = str(audio.channels)
+		
+		if config.audioReenc:
+			if audio.bitRate == 0:
+				encodePlan.debug.append("** The input bitrate is 0/unknown, copying audio")
+			elif audio.channels > 2:
+				if config.audioReencForce or audio.bitRate > config.audioReencBitRateSurround:
+					encodePlan.debug.append("** Reencoding surround audio (input %s kb/s, target %s kb/s, force: %s)" % (audio.bitRate, config.audioReencBitRateSurround, config.audioReencForce))
+					encodePlan.doReencAudio = True
+					encodePlan.audioOpt = surroundOpt
+					tagAudio = config.audioReencCodec
+					tagChannels = str(config.audioReencChannelsSurround)
+			else:
+				if config.audioReencForce or audio.bitRate > config.audioReencBitRateStereo:
+					encodePlan.debug.append("** Reencoding stereo audio (input %s kb/s, target %s kb/s, force: %s)" % (audio.bitRate, config.audioReencBitRateStereo, config.audioReencForce))
+					encodePlan.doReencAudio = True
+					encodePlan.audioOpt = stereoOpt
+					tagAudio = config.audioReencCodec
+			
+			### Force reencode of TrueHD audio
+			
+			if audio.codecName == "truehd":
+				encodePlan.doReencAudio = True
+				encodePlan.audioOpt = surroundOpt
+				tagAudio = config.audioReencCodec
+				tagChannels = str(config.audioReencChannelsSurround)
+		
+		if config.audioDownmix and audio.channels > config.audioDownmixChannels:
+			encodePlan.doDownmix = True
+			encodePlan.audioOpt = "-c:a " + config.audioDownmixCodec + " -b:a " + str(config.audioDownmixBitRate) + "k -ac " + str(config.audioDownmixChannels)
+			tagAudio = config.audioDownmixCodec
+			tagChannels = str(config.audioDownmixChannels)
+		
+		### Output audio summary
+		
+		if encodePlan.audioOpt == "-c:a copy":
+			encodePlan.outputAudCodec = audio.codecName
+			encodePlan.outputAudBit = audio.bitRateDisplay
+			encodePlan.outputAudChannels = audio.channelsDisplay
+		elif encodePlan.doDownmix:
+			encodePlan.outputAudCodec = config.audioDownmixCodec
+			encodePlan.outputAudBit = str(config.audioDownmixBitRate)
+			encodePlan.outputAudChannels = str(config.audioDownmixChannels)
+		elif audio.channels > 2:
+			encodePlan.outputAudCodec = config.audioReencCodec
+			encodePlan.outputAudBit = str(config.audioReencBitRateSurround)
+			encodePlan.outputAudChannels = str(config.audioReencChannelsSurround)
+		else:
+			encodePlan.outputAudCodec = config.audioReencCodec
+			encodePlan.outputAudBit = str(config.audioReencBitRateStereo)
+			encodePlan.outputAudChannels = audio.channelsDisplay
+	
+	### Construct destination filename/path
+	
+	if encodePlan.targVidWidth == 1920:
+		tagRes = "1080p"
+	elif encodePlan.targVidHeight == 1280:
+		tagRes = "720p"
+	else:
+		tagRes = str(video.height) + "p"
+	
+	if config.videoTargCodec == "libx265":
+		tagCodec = "HEVC"
+		tagEncoder = "x265"
+	elif config.videoTargCodec == "libx264":
+		tagCodec = "AVC"
+		tagEncoder = "x264"
+	else:
+		tagCodec = "tagCodec"
+		tagEncoder = "tagEncoder"
+	
+	if tagCodec != "tagCodec" and tagEncoder != "tagEncoder":
+		encodePlan.outputVidFormat = tagCodec + " / " + tagEncoder
+	else:
+		encodePlan.outputVidFormat = config.videoTargCodec
+	
+	inputPath, inputFile = os.path.split(probe.path)
+	nameParts = [os.path.splitext(inputFile)[0], tagRes, tagCodec, tagEncoder]
+	
+	if audio is not None:
+		tagAudio = audioNameTags.get(tagAudio, tagAudio).upper()
+		nameParts = nameParts + [tagChannels + "ch", tagAudio]
+	
+	newName = ".".join(nameParts) + config.fileTag + ".mkv"
+	anPattern = re.compile('[^a-zA-Z0-9_.-]')
+	encodePlan.newName = anPattern.sub('', newName)
+	
+	if config.destDir == "":
+		encodePlan.finalDest = os.path.join(inputPath, encodePlan.newName)
+	else:
+		encodePlan.finalDest = os.path.join(config.destDir, encodePlan.newName)
+	
+	return encodePlan
+
+### Filename tags for audio encoders that don't read well uppercased
+
+audioNameTags = {"libopus": "OPUS", "libvorbis": "OGG", "vorbis": "OGG", "libfdk_aac": "AAC", "libmp3lame": "MP3", "libtwolame": "MP2", "mp2": "MP2", "wmav2": "WMA", "wmav1": "WMA"}
+
+### Buffer a job's output so blocks from concurrent jobs aren't interleaved in the log
+
+class JobLog:
+	
+	def __init__(self, name=None):
+		self.name = name
+		self.lines = []
+	
+	def info(self, msg, *args):
+		if args: msg = msg % args
+		self.lines.append(msg)
+	
+	def newline(self, how_many_lines=1):
+		for i in range(how_many_lines):
+			self.lines.append(None)
+	
+	def flush(self):
+		with logLock:
+			for line in self.lines:
+				if line is None:
+					logger.newline()
+				else:
+					logger.info(line, extra={"job": self.name})
+		self.lines = []
+
+### Planned jobs waiting for an encoder (at most maxsize, 0 = no limit), handed out in schedulePolicy order so
+### that no device (input or output) has more than jobsPerDevice encodes at once, preferring jobs on the least
+### busy devices so work is spread across disks.  Encoders call done() when a job is finished, get() returns None once closed & empty.
+
+class JobScheduler:
+	
+	def __init__(self, maxsize):
+		self.cond = threading.Condition()
+		self.jobs = []
+		self.maxsize = maxsize
+		self.closed = False
+		self.deviceJobs = {}
+	
+	def put(self, job):
+		with self.cond:
+			while self.maxsize > 0 and len(self.jobs) >= self.maxsize:
+				self.cond.wait()
+			self.jobs.append(job)
+			self.cond.notify_all()
+	
+	def close(self):
+		with self.cond:
+			self.closed = True
+			self.cond.notify_all()
+	
+	def device_load(self, job):
+		return sum(self.deviceJobs.get(device, 0) for device in job["devices"])
+	
+	### schedulePolicy decides first, device load breaks ties (then queue order)
+	
+	def rank(self, job):
+		if schedulePolicy == "savings": return (-job.get("savingsRate", 0), self.device_load(job))
+		if schedulePolicy == "lpt": return (-job.get("expectedCpu", 0), self.device_load(job))
+		return (self.device_load(job),)
+	
+	### Waiting jobs in the order they'd be handed out (ignoring device caps), for input staging
+	
+	def upcoming(self):
+		with self.cond:
+			return sorted(self.jobs, key=self.rank)
+	
+	def pick(self):
+		ready = [job for job in self.jobs if jobsPerDevice <= 0 or all(self.deviceJobs.get(device, 0) < jobsPerDevice for device in job["devices"])]
+		if not ready: return None
+		return min(ready, key=self.rank)
+	
+	def get(self):
+		with self.cond:
+			while True:
+				job = self.pick()
+				if job is not None:
+					self.jobs.remove(job)
+					for device in job["devices"]:
+						self.deviceJobs[device] = self.deviceJobs.get(device, 0) + 1
+					self.cond.notify_all()
+					return job
+				if self.closed and not self.jobs: return None
+				self.cond.wait()
+	
+	def done(self, job):
+		with self.cond:
+			for device in job["devices"]:
+				self.deviceJobs[device] -= 1
+			self.cond.notify_all()
+
+### Cpu time (clock ticks) a process has used so far, None once it's gone
+
+def proc_cpu_ticks(pid):
+	
+	try:
+		with open("/proc/%s/stat" % pid) as statFile:
+			fields = statFile.read().rpartition(")")[2].split()
+	except OSError:
+		return None
+	return int(fields[11]) + int(fields[12])
+
+### "some avg10" of a /proc/pressure file (percent of the last 10 sec some task stalled), None without PSI
+
+def read_pressure(resource):
+	
+	try:
+		with open("/proc/pressure/" + resource) as pressureFile:
+			for line in pressureFile:
+				if line.startswith("some"):
+					return float(line.split()[1].partition("=")[2])
+	except (OSError, ValueError, IndexError):
+		pass
+	return None
+
+### MemAvailable as a percent of MemTotal
+
+def read_mem_available():
+	
+	memInfo = {}
+	with open("/proc/meminfo") as memFile:
+		for line in memFile:
+			key, sep, value = line.partition(":")
+			memInfo[key] = int(value.split()[0])
+	return 100.0 * memInfo["MemAvailable"] / max(1, memInfo["MemTotal"])
+
+### Off-peak windows ("[days] HH:MM-HH:MM", e.g. "Mon-Fri 22:00-07:00" or "Sat,Sun 00:00-24:00") as
+### (weekdays, start minute, end minute).  A window past midnight belongs to the day it starts on.
+
+weekDays = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+def parse_window(window):
+	
+	parts = window.split()
+	if len(parts) not in (1, 2): raise ValueError(window)
+	days = set(range(7))
+	if len(parts) == 2:
+		days = set()
+		for dayRange in parts[0].lower().split(","):
+			first, sep, last = dayRange.partition("-")
+			firstDay, lastDay = weekDays.index(first[:3]), weekDays.index((last or first)[:3])
+			days.update((firstDay + i) % 7 for i in range((lastDay - firstDay) % 7 + 1))
+	minutes = []
+	for clock in parts[-1].split("-"):
+		hour, minute = (int(n) for n in clock.split(":"))
+		if not (0 <= hour <= 24 and 0 <= minute < 60): raise ValueError(window)
+		minutes.append(hour * 60 + minute)
+	if len(minutes) != 2: raise ValueError(window)
+	return days, minutes[0], minutes[1]
+
+def in_window(now, windows):
+	
+	minute = now.hour * 60 + now.minute
+	day = now.weekday()
+	for days, start, end in windows:
+		if start < end:
+			if day in days and start <= minute < end: return True
+		elif (day in days and minute >= start) or ((day - 1) % 7 in days and minute < end):
+			return True
+	return not windows
+
+### Encode slots & running ffmpegs, steered by encodeWindows and resource pressure on the host, checked every
+### governorInterval seconds.
+###
+### Outside encodeWindows, no new encodes start and running ffmpegs are suspended with SIGSTOP (never killed,
+### so no cpu time is lost), then continued with SIGCONT when a window opens.
+###
+### With resourceGovernor, the load average left after our own ffmpegs' cpu use, MemAvailable and memory/io
+### pressure are checked against the governor* limits.  Under pressure one fewer encode may run (down to 1),
+### and running ffmpegs are paused if memory runs short, pressure is twice the limit, or it stays high at a
+### single encode.  Once everything is below 3/4 of the limits, paused ffmpegs are continued and encodes are
+### added back one at a time.
+###
+### clock() only advances while ffmpegs aren't stopped, so encode times leave out suspended time.
+
+class EncodeGovernor:
+	
+	def __init__(self, maxJobs):
+		self.cond = threading.Condition()
+		self.maxJobs = maxJobs
+		self.limit = maxJobs
+		self.running = 0
+		self.paused = False
+		self.held = False
+		self.stopped = False
+		self.stoppedAt = 0.0
+		self.stoppedTotal = 0.0
+		self.procs = {}
+		self.stop = threading.Event()
+	
+	def acquire(self):
+		with self.cond:
+			while self.running >= self.limit or self.held:
+				self.cond.wait()
+			self.running += 1
+	
+	def release(self):
+		with self.cond:
+			self.running -= 1
+			self.cond.notify_all()
+	
+	### ffmpegs started while stopped are stopped right away
+	
+	def register(self, pid):
+		with self.cond:
+			self.procs[pid] = proc_cpu_ticks(pid) or 0
+			if self.stopped: os.kill(pid, signal.SIGSTOP)
+	
+	def unregister(self, pid):
+		with self.cond:
+			del self.procs[pid]
+	
+	### Pause (pressure) or hold (outside encodeWindows), ffmpegs are stopped while either is set (and never
+	### once the governor is stopped)
+	
+	def set_state(self, paused=None, held=None):
+		with self.cond:
+			if paused is not None: self.paused = paused
+			if held is not None: self.held = held
+			stopped = (self.paused or self.held) and not self.stop.is_set()
+			if stopped != self.stopped:
+				self.stopped = stopped
+				if stopped:
+					self.stoppedAt = time.time()
+				else:
+					self.stoppedTotal += time.time() - self.stoppedAt
+				for pid in self.procs:
+					os.kill(pid, signal.SIGSTOP if stopped else signal.SIGCONT)
+			self.cond.notify_all()
+	
+	def shutdown(self):
+		self.stop.set()
+		self.set_state()
+	
+	def clock(self):
+		with self.cond:
+			return (self.stoppedAt if self.stopped else time.time()) - self.stoppedTotal
+	
+	### Cores our ffmpegs used since the last sample
+	
+	def own_cores(self, interval):
+		with self.cond:
+			used = 0
+			for pid, lastTicks in self.procs.items():
+				ticks = proc_cpu_ticks(pid)
+				if ticks is None: continue
+				used += ticks - lastTicks
+				self.procs[pid] = ticks
+		return used / os.sysconf("SC_CLK_TCK") / interval
+	
+	### Hold or release encodes as encodeWindows close & open
+	
+	def check_window(self):
+		held = not in_window(datetime.datetime.now(), encodeWindowList)
+		if held == self.held: return
+		self.set_state(held=held)
+		with logLock:
+			if held:
+				logger.info("-- Outside encodeWindows, holding new encodes and suspending running ffmpegs (%s)" % len(self.procs))
+			else:
+				logger.info("++ encodeWindows open, resuming encodes")
+		log_event("window", held=held)
+	
+	### 2 = pause now, 1 = cut back, 0 = hold, -1 = calm enough to add an encode back
+	
+	def pressure_level(self, load, memAvailable, pressure):
+		if memAvailable < governorMinMemory / 2 or pressure > governorMaxPressure * 2: return 2
+		if load > governorMaxLoad or memAvailable < governorMinMemory or pressure > governorMaxPressure: return 1
+		if load < governorMaxLoad * 0.75 and memAvailable > governorMinMemory / 0.75 and pressure < governorMaxPressure * 0.75: return -1
+		return 0
+	
+	def check_pressure(self, interval):
+		load = max(0.0, os.getloadavg()[0] - self.own_cores(interval)) / cpuCount
+		memAvailable = read_mem_available()
+		pressure = max(read_pressure("memory") or 0.0, read_pressure("io") or 0.0)
+		level = self.pressure_level(load, memAvailable, pressure)
+		
+		limit, paused = self.limit, self.paused
+		if level == 2 or (level == 1 and self.limit == 1):
+			paused = True
+		elif level == 1:
+			limit -= 1
+		elif level == -1 and self.paused:
+			paused = False
+		elif level == -1 and self.limit < self.maxJobs:
+			limit += 1
+		if (limit, paused) == (self.limit, self.paused): return
+		
+		with self.cond:
+			self.limit = limit
+		self.set_state(paused=paused)
+		with logLock:
+			logger.info("%s Governor: %s (load/cpu %s | mem available %s%% | pressure %s%%)" % ("--" if level > 0 else "++", "paused" if paused else "%s of %s encodes" % (limit, self.maxJobs), round(load, 2), round(memAvailable, 1), round(pressure, 1)))
+		log_event("governor", limit=limit, paused=paused, load=round(load, 2), memAvailable=round(memAvailable, 1), pressure=round(pressure, 1))
+	
+	def run(self):
+		lastSample = time.time()
+		self.own_cores(1)
+		while not self.stop.wait(governorInterval):
+			now = time.time()
+			if encodeWindowList: self.check_window()
+			if resourceGovernor: self.check_pressure(max(0.001, now - lastSample))
+			lastSample = now
+		
+		### Never leave ffmpegs stopped behind
+		
+		self.set_state()
+
+### Continue stopped ffmpegs before dying to ctrl-c or SIGTERM, so they see the signal too and none are left stopped
+
+def resume_on_signal(signum, frame):
+	
+	encodeGovernor.shutdown()
+	if signum == signal.SIGINT: signal.default_int_handler(signum, frame)
+	signal.signal(signum, signal.SIG_DFL)
+	os.kill(os.getpid(), signum)
+
+### Whether a file is worth probing by its name (mediaExtensions) and a folder should never be walked
+
+def media_file(filename):
+	
+	return not mediaExtensions or filename.lower().endswith(tuple(extension.lower() for extension in mediaExtensions))
+
+def pruned_folder(name, path):
+	
+	return name.startswith(".") or "vidChew3" in name or name in excludeDirs or path == queueDir or (destDir != "" and path == os.path.abspath(destDir))
+
+### Walk the input folder with os.scandir, yielding (folder, filename, stat) for likely media files as each
+### folder is read, so probing starts right away.  Hidden, excluded, vidChew3, destDir & queueDir folders are
+### pruned, and files are filtered by extension and size using the DirEntry's stat (reused by the probe stage).
+### folderCallback, if given, is called with each folder as it's read.
+
+def walk_inputs(top, folderCallback=None):
+	
+	folders = [top]
+	
+	while folders and not stopEvent.is_set():
+		
+		folder = folders.pop()
+		try:
+			with os.scandir(folder) as scan:
+				entries = sorted(scan, key=lambda entry: entry.name)
+		except OSError as walkExc:
+			with logLock:
+				logger.info("!! Can't read folder: %s" % repr(walkExc))
+			continue
+		walkTotals["folders"] += 1
+		if folderCallback is not None: folderCallback(folder)
+		
+		subfolders = []
+		for entry in entries:
+			try:
+				if entry.is_dir(follow_symlinks=False):
+					if pruned_folder(entry.name, entry.path): continue
+					subfolders.append(entry.path)
+				elif entry.is_file():
+					if not media_file(entry.name):
+						walkTotals["filtered"] += 1
+						continue
+					entryStat = entry.stat()
+					if entryStat.st_size < minInputSize * 1000000:
+						walkTotals["filtered"] += 1
+						continue
+					walkTotals["files"] += 1
+					yield folder, entry.name, entryStat
+			except OSError:
+				continue
+		
+		### Depth first, in name order like os.walk & sorted()
+		
+		folders.extend(reversed(subfolders))
+
+### Hand a file to the probe stage, waiting for a free probe slot.  Returns False if the run is stopping.
+
+def submit_probe(probePool, root, filename, inputStat):
+	
+	probeSlots.acquire()
+	if stopEvent.is_set():
+		probeSlots.release()
+		return False
+	future = probePool.submit(probe_job, root, filename, inputStat)
+	future.add_done_callback(probe_done)
+	return True
+
+### inotify through libc (Linux), returns (libc, fd) or None if it isn't available
+
+inotifyMask = 0x00000008 | 0x00000080 | 0x00000100   # IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+def inotify_open():
+	
+	try:
+		libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+		inotifyFd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+	except (OSError, AttributeError, TypeError):
+		return None
+	if inotifyFd < 0: return None
+	return libc, inotifyFd
+
+### Watch mode: walk the input folder once, then keep watching it.  Every file found (by the walk, an inotify
+### event or a polling rescan) waits until its size & mtime haven't changed for watchSettle seconds, then goes
+### to the probe stage.  Falls back to rescanning every watchPoll seconds without inotify.
+
+def watch_inputs(probePool):
+	
+	waiting = {}   # path -> (size, mtime, stable since)
+	handedOver = {}   # path -> (size, mtime) already sent to the probe stage
+	watchedFolders = {}
+	inotify = inotify_open()
+	nextScan = float("inf")
+	
+	### Once a watch fails (e.g. out of watches), inotify is dropped and rescans start every watchPoll sec
+	
+	def add_watch(folder):
+		nonlocal inotify, nextScan
+		if inotify is None: return
+		libc, inotifyFd = inotify
+		watchDesc = libc.inotify_add_watch(inotifyFd, os.fsencode(folder), inotifyMask)
+		if watchDesc < 0:
+			with logLock:
+				logger.info("-- inotify watch failed (%s), polling every %s sec instead" % (os.strerror(ctypes.get_errno()), watchPoll))
+			os.close(inotifyFd)
+			inotify = None
+			nextScan = time.time() + watchPoll
+			return
+		watchedFolders[watchDesc] = folder
+	
+	def note(path, inputStat):
+		stamp = (inputStat.st_size, inputStat.st_mtime_ns)
+		if handedOver.get(path) == stamp: return
+		if path in waiting and waiting[path][:2] == stamp: return
+		waiting[path] = stamp + (min(time.time(), inputStat.st_mtime_ns / 1000000000),)
+	
+	def scan(folder):
+		for root, filename, inputStat in walk_inputs(folder, add_watch):
+			note(os.path.join(root, filename), inputStat)
+	
+	if inotify is None:
+		logger.info("-- inotify unavailable, polling every %s sec" % watchPoll)
+	scan(inputFolder)
+	if inotify is None: nextScan = time.time() + watchPoll
+	
+	while not stopEvent.is_set():
+		
+		### Collect inotify events (new folders are watched & scanned), or rescan when polling
+		
+		if inotify is not None:
+			libc, inotifyFd = inotify
+			if select.select([inotifyFd], [], [], 1)[0]:
+				try:
+					events = os.read(inotifyFd, 65536)
+				except BlockingIOError:
+					events = b""
+				offset = 0
+				while offset < len(events):
+					watchDesc, eventMask, cookie, nameLength = struct.unpack_from("iIII", events, offset)
+					name = os.fsdecode(events[offset + 16:offset + 16 + nameLength].rstrip(b"\0"))
+					offset += 16 + nameLength
+					if eventMask & 0x4000:   # IN_Q_OVERFLOW, events were lost
+						nextScan = 0
+						continue
+					if eventMask & 0x8000:   # IN_IGNORED, folder went away
+						watchedFolders.pop(watchDesc, None)
+						continue
+					if watchDesc not in watchedFolders or name == "": continue
+					path = os.path.join(watchedFolders[watchDesc], name)
+					try:
+						if eventMask & 0x40000000:   # IN_ISDIR
+							if not pruned_folder(name, path): scan(path)
+						elif media_file(name):
+							note(path, os.stat(path))
+					except OSError:
+						continue
+		else:
+			stopEvent.wait(1)
+		
+		if time.time() >= nextScan:
+			scan(inputFolder)
+			nextScan = time.time() + watchPoll if inotify is None else float("inf")
+		
+		### Hand over the files that have settled
+		
+		for path, (size, mtime, stableSince) in list(waiting.items()):
+			try:
+				inputStat = os.stat(path)
+			except OSError:
+				del waiting[path]
+				continue
+			if (inputStat.st_size, inputStat.st_mtime_ns) != (size, mtime):
+				waiting[path] = (inputStat.st_size, inputStat.st_mtime_ns, time.time())
+			elif time.time() - stableSince >= watchSettle:
+				del waiting[path]
+				handedOver[path] = (size, mtime)
+				if size < minInputSize * 1000000: continue
+				if not submit_probe(probePool, os.path.dirname(path), os.path.basename(path), inputStat): return
+
+### Probe and plan a single input file, then hand it to the encoders
+
+def probe_job(root, filename, inputStat=None):
+	
+	jobLog = JobLog(os.path.join(root, filename))
+	try:
+		job = prepare_job(jobLog, root, filename, inputStat)
+	except:
+		jobLog.flush()
+		raise
+	if job is None:
+		jobLog.flush()
+		return
+	log_event("planned", job["inputAbsPath"], planHash=job["planHash"], sourceRes=job["sourceRes"], targetRes=job["targetRes"], duration=job["inputDuration"], inputBytes=job["inputBytes"])
+	
+	### In coordinator mode, planned jobs go to the shared queue instead of the local encoders
+	
+	if runMode == "coordinator":
+		queue_submit(job)
+		job["log"].flush()
+		return
+	
+	### In plan mode, planned jobs are only collected for the capacity report
+	
+	if runMode == "plan":
+		if debug: job["log"].flush()
+		with progressLock:
+			plannedJobs.append({key: value for key, value in job.items() if key != "log"})
+		return
+	
+	### Blocks once prefetchDepth planned jobs are already waiting on an encoder
+	
+	expectedBytes, expectedCpu = estimate_job(job, scheduleHistory)
+	job["savingsRate"] = (job["inputBytes"] - expectedBytes) / max(1.0, expectedCpu)
+	job["expectedCpu"] = expectedCpu
+	if debug: job["log"].info("** Expected: %s MB output, %s cpu-sec, %s MB saved per cpu-sec" % (round(expectedBytes / 1000000, 1), round(expectedCpu), round(job["savingsRate"] / 1000000, 3)))
+	
+	### Counted as queued only once put() returns (an encoder can take it first, so the totals may briefly dip)
+	
+	readyJobs.put(job)
+	with progressLock:
+		progressTotals["queuedDuration"] += job["inputDuration"]
+		progressTotals["queuedCount"] += 1
+
+### Release the walker's probe slot and report unexpected errors
+
+def probe_done(future):
+	
+	probeSlots.release()
+	if future.exception() is not None:
+		with logLock:
+			logger.info("!! Probe crashed: %s" % repr(future.exception()))
+
+### Encoder thread, pulls planned jobs until it sees the stop sentinel
+
+def encode_worker():
+	
+	while True:
+		encodeGovernor.acquire()
+		job = readyJobs.get()
+		if job is None:
+			encodeGovernor.release()
+			break
+		with progressLock:
+			progressTotals["queuedDuration"] -= job["inputDuration"]
+			progressTotals["queuedCount"] -= 1
+		try:
+			if not stopEvent.is_set():
+				encode_job(job)
+		except Exception as encodeExc:
+			job["log"].info("!! Encode crashed: %s" % repr(encodeExc))
+		finally:
+			encodeGovernor.release()
+			readyJobs.done(job)
+			release_staged_input(job)
+			if "offload" not in job: job["log"].flush()
+
+### Probe a single input file, select tracks, and build its ffmpeg cmd (inputStat saves a stat if the walk has one)
+
+def prepare_job(logger, root, filename, inputStat=None):
+
+	silentSkipArray = ['vidChew3']
+	doSilentSkip = False
+	
+	for silentSkip in silentSkipArray:
+		if silentSkip in filename:
+			if debug: logger.info("** Filename contains \"%s\" (silent skip)!" % (silentSkip))
+			doSilentSkip = True
+	if doSilentSkip: return
+	
+	fullInputFile = os.path.join(root, filename)
+	inputAbsPath = os.path.abspath(fullInputFile)
+	inputPath, inputFile = os.path.split(inputAbsPath)
+	inputBaseFile = os.path.splitext(inputFile)[0]
+	logger.newline()
+	logger.info("-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+")
+	logger.info('! Input: %s' % (inputFile))
+	logger.info('! Folder: %s' % (root))
+	logger.info("-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+")
+	logger.newline()
+	
+	### Determine whether or not to skip based on filenameSkipArray
+	
+	doSkip = False
+		
+	for skip in filenameSkipArray:
+		if skip in inputFile:
+			logger.info("!! Filename contains \"%s\"!  Skipping..." % (skip))
+			doSkip = True
+	if doSkip: return
+	
+	### Obtain input filesize, convert to MB
+	
+	if inputStat is None: inputStat = os.stat(inputAbsPath)
+	inputSize = int(inputStat.st_size) / 1000000
+	inputSize = str(round(inputSize, 2))
+
+	### Obtain ffprobe output in json format (or from the probe cache), decode, and parse
+
+	data = probe_input(inputAbsPath, inputStat)
+	if data is None:
+		logger.info("!! Could not retrieve input video info via ffprobe!")
 		logger.newline()
-		logger.info("++ %s (%s MB | %s kb/s)" % (inputFile, inputSize, overallBitrate))
+		return
+	
+	### Normalize the probe into compact stream records, then plan track selection & options in one pass
+	
+	probe = normalize_probe(data, inputAbsPath, inputStat.st_size)
+	encodePlan = plan(probe, plan_config(destDir=destDir))
+	
+	if encodePlan.video is None:
+		logger.info("!! No video track found!  Skipping...")
 		logger.newline()
-		logger.info(":: Video")
-		logger.info("\t track: %s | %sx%s (%s) | codec: %s" % (targVidTrack, bfVideoWidth, bfVideoHeight, bfVideoDisplayAr, bfVideoCodecName))
+		return
+	
+	inputDuration = probe.duration
+	
+	### Display streams & selection
+	
+	logger.info("-+- Track Selection -+-")
+	logger.newline()
+	logger.info("++ Number of streams: %s (%s MB | %s kb/s)" % (probe.streamCount, inputSize, probe.bitRate))
+	logger.newline()
+	
+	video = encodePlan.video
+	logger.info(":: Video")
+	logger.info("!! Chose first video track!")
+	logger.info("\t index: %s | codecName: %s | Resolution: %sx%s (%s)" % (video.index, video.codecName, video.width, video.height, video.displayAr))
+	
+	logger.newline()
+	logger.info(":: Audio")
+	logger.info("++ Number of audio streams: %s" % len(probe.audio))
+	for stream in probe.audio:
+		logger.info("\t index: %s | language: %s | codecName: %s | channels: %s | bitRate: %s kb/s" % (stream.index, stream.language, stream.codecName, stream.channelsDisplay, stream.bitRateDisplay))
+	if len(probe.audio) == 1:
+		logger.info("++ Only one audio track found, choosing...")
+	elif len(probe.audio) > 1:
+		logger.info("++ Multiple audio tracks found, deep searching...")
+	if debug:
+		for line in encodePlan.debug:
+			logger.info(line)
+	
+	audio = encodePlan.audio
+	if audio is not None:
 		logger.newline()
-		if audioFound: logger.info(":: Audio")
-		if audioFound: logger.info("\t track: %s | language: %s | %s @ %s kb/s (%s ch)" % (targAudioTrack, bfAudioLanguage, bfAudioCodecName, bfAudioBitrateDisplay, bfAudioChannelsDisplay))
-		if audioFound: logger.newline()
-		if subtitleFound: logger.info(":: Subtitle")
-		if subtitleFound: logger.info("\t index: %s | language: %s | codecName: %s" % (bfSubtitleIndex, bfSubtitleLanguage, bfSubtitleCodecName))
-		if subtitleFound: logger.newline()
-		logger.info("-+- Options -+-")
+		logger.info("!! Audio Track Chosen!")
+		logger.info("\t index: %s | language: %s | codecName: %s | channels: %s | bitRate: %s kb/s" % (audio.index, audio.language, audio.codecName, audio.channelsDisplay, audio.bitRateDisplay))
 		logger.newline()
-		logger.info("\t targLang: %s" % targLang)
-		if videoDownscale: logger.info("\t videoDownscale: %s | %sx%s | force16: %s" % (str(videoDownscale), str(maxVidWidth), str(maxVidHeight), str(force16)))
-		logger.info("\t preferredAudioFormats: %s" % prefAudioFormatsList)
-		if audioReenc: logger.info("\t audioReenc: %s | %s @ %s (surround, %s ch) / %s (stereo) kb/s" % (str(audioReenc), audioReencCodec, str(audioReencBitRateSurround), str(audioReencChannelsSurround), str(audioReencBitRateStereo)))
-		if audioReenc and audioReencForce: logger.info("\t audioReencForce: enabled")
-		if audioDownmix: logger.info("\t audioDownmix: %s | %s @ %s kb/s (%s ch)" % (str(audioDownmix), audioDownmixCodec, str(audioDownmixBitRate), str(audioDownmixChannels)))
-		logger.info("\t fileTag: %s" % fileTag)
-		logger.newline()		
-		logger.info("-+- Output -+-")
+	else:
+		logger.info("!! No audio track found!")
 		logger.newline()
-		logger.info(":: Video")
-		logger.info("\t %s | preset: %s | crf: %s | %sx%s (%s)" % (outputVidFormat, videoTargCodecPreset, videoTargCrf, outputVidWidth, outputVidHeight, outputVidAr))
-		if videoDownscale and not doDownscale: logger.info("\t !! Downscaling unnecessary")
-		if videoDownscale:
-			if force16 and not doForce16: logger.info("\t !! Forcing of 16:9 aspect ratio unnecessary") 
+	
+	logger.info(":: Subtitle")
+	logger.info("++ Number of subtitle streams: %s" % len(probe.subtitle))
+	for stream in probe.subtitle:
+		logger.info("\t index: %s | language: %s | codecName: %s" % (stream.index, stream.language, stream.codecName))
+	
+	subtitle = encodePlan.subtitle
+	if subtitle is not None:
+		logger.newline()
+		logger.info("!! Subtitle Track Chosen!")
+		logger.info("\t index: %s | language: %s | codecName: %s" % (subtitle.index, subtitle.language, subtitle.codecName))
+	else:
+		logger.info("!! No %s subtitle track found!" % (targLang))
+	
+	finalDest = encodePlan.finalDest
+	
+	if debug:
 		logger.newline()
-		if audioFound: logger.info(":: Audio")
-		if audioFound: logger.info("\t language: %s | %s @ %s kb/s (%s ch)" % (bfAudioLanguage, outputAudCodec, outputAudBit, outputAudChannels))
-		if audioFound and audioReenc and not doReencAudio: logger.info("\t !! Not reencoding audio because input audio track bitrate (%s kb/s) is either <= target bitrate (%s [surround] / %s [stereo] kb/s) or is unknown" % (bfAudioBitrateDisplay, str(audioReencBitRateSurround), str(audioReencBitRateStereo)))
-		if audioFound and audioDownmix and not doDownmix: logger.info("\t !! Not downmixing audio because input audio track (%s) is already <= target downmix channels (%s)" % (bfAudioChannelsDisplay, str(audioDownmixChannels)))
-		if subtitleFound: logger.newline()
-		if subtitleFound: logger.info(":: Subtitle")
-		if subtitleFound: logger.info("\t language: %s | codec: %s" % (bfSubtitleLanguage, outputSubtitleCodec))
+		logger.info('** Filename Construction')
+		logger.info(inputAbsPath)
+		logger.info(inputPath)
+		logger.info(inputFile)
+		logger.info(inputBaseFile)
+		logger.info(finalDest)
+	
+	### Video bitrate target for CRF tuning, from the output's resolution class (videoTargCrf if there's no
+	### class at or below the output height)
+	
+	targetBitRate = None
+	if autoCrf:
+		targetBitRate = next((autoCrfBitRates[height] for height in sorted(autoCrfBitRates, reverse=True) if height <= encodePlan.targVidHeight), None)
+		if targetBitRate is None: logger.info("-- No autoCrfBitRates class at or below %sp, using videoTargCrf" % encodePlan.targVidHeight)
+	
+	### Pre-encode data summary
+	
+	prefAudioFormatsList = ' '.join(prefAudioFormats)
+	
+	logger.newline()
+	logger.info("-+- Input -+-")
+	logger.newline()
+	logger.info("++ %s (%s MB | %s kb/s)" % (inputFile, inputSize, probe.bitRate))
+	logger.newline()
+	logger.info(":: Video")
+	logger.info("\t track: %s | %sx%s (%s) | codec: %s" % (video.index, video.width, video.height, video.displayAr, video.codecName))
+	logger.newline()
+	if audio is not None: logger.info(":: Audio")
+	if audio is not None: logger.info("\t track: %s | language: %s | %s @ %s kb/s (%s ch)" % (audio.index, audio.language, audio.codecName, audio.bitRateDisplay, audio.channelsDisplay))
+	if audio is not None: logger.newline()
+	if subtitle is not None: logger.info(":: Subtitle")
+	if subtitle is not None: logger.info("\t index: %s | language: %s | codecName: %s" % (subtitle.index, subtitle.language, subtitle.codecName))
+	if subtitle is not None: logger.newline()
+	logger.info("-+- Options -+-")
+	logger.newline()
+	logger.info("\t targLang: %s" % targLang)
+	if videoDownscale: logger.info("\t videoDownscale: %s | %sx%s | force16: %s" % (str(videoDownscale), str(maxVidWidth), str(maxVidHeight), str(force16)))
+	logger.info("\t preferredAudioFormats: %s" % prefAudioFormatsList)
+	if audioReenc: logger.info("\t audioReenc: %s | %s @ %s (surround, %s ch) / %s (stereo) kb/s" % (str(audioReenc), audioReencCodec, str(audioReencBitRateSurround), str(audioReencChannelsSurround), str(audioReencBitRateStereo)))
+	if audioReenc and audioReencForce: logger.info("\t audioReencForce: enabled")
+	if audioDownmix: logger.info("\t audioDownmix: %s | %s @ %s kb/s (%s ch)" % (str(audioDownmix), audioDownmixCodec, str(audioDownmixBitRate), str(audioDownmixChannels)))
+	if targetBitRate is not None: logger.info("\t autoCrf: %s kb/s (crf %s-%s)" % (targetBitRate, autoCrfRange[0], autoCrfRange[1]))
+	logger.info("\t fileTag: %s" % fileTag)
+	logger.newline()		
+	logger.info("-+- Output -+-")
+	logger.newline()
+	logger.info(":: Video")
+	logger.info("\t %s | preset: %s | crf: %s | %sx%s (%s)" % (encodePlan.outputVidFormat, encodePlan.preset, encodePlan.crf, encodePlan.targVidWidth, encodePlan.targVidHeight, encodePlan.outputVidAr))
+	if videoDownscale and not encodePlan.doDownscale: logger.info("\t !! Downscaling unnecessary")
+	if videoDownscale:
+		if force16 and not encodePlan.doForce16: logger.info("\t !! Forcing of 16:9 aspect ratio unnecessary") 
+	logger.newline()
+	if audio is not None: logger.info(":: Audio")
+	if audio is not None: logger.info("\t language: %s | %s @ %s kb/s (%s ch)" % (audio.language, encodePlan.outputAudCodec, encodePlan.outputAudBit, encodePlan.outputAudChannels))
+	if audio is not None and audioReenc and not encodePlan.doReencAudio: logger.info("\t !! Not reencoding audio because input audio track bitrate (%s kb/s) is either <= target bitrate (%s [surround] / %s [stereo] kb/s) or is unknown" % (audio.bitRateDisplay, str(audioReencBitRateSurround), str(audioReencBitRateStereo)))
+	if audio is not None and audioDownmix and not encodePlan.doDownmix: logger.info("\t !! Not downmixing audio because input audio track (%s) is already <= target downmix channels (%s)" % (audio.channelsDisplay, str(audioDownmixChannels)))
+	if subtitle is not None: logger.newline()
+	if subtitle is not None: logger.info(":: Subtitle")
+	if subtitle is not None: logger.info("\t language: %s | codec: %s" % (subtitle.language, encodePlan.outputSubtitleCodec))
+	
+	### Encode
+	
+	logger.newline()
+	logger.info("-+- Encode -+-")
+	logger.newline()
+	logger.info("!! Destination: %s" % (finalDest))
+	
+	### Enable ffmpeg logging, if requested
+	
+	if ffmpegLogs:
+		destAbsPath = os.path.abspath(finalDest)
+		finalPath, finalFile = os.path.split(destAbsPath)
+		reportFilename = finalFile + "-report.log"
+		reportDest = inputPath + "/" + reportFilename
+		logger.info("++ ffmpeg log: %s" % (reportFilename + reportSuffix))
+		reportEnv = "file=" + reportDest + ":level=40"
+	else:
+		reportDest = ""
+		reportEnv = ""
+		
+	### Size encoder threads per job
+	
+	inputThreadOpt = ""
+	threadOpt = ""
+	if coresPerJob > 0:
+		inputThreadOpt = "-threads " + str(coresPerJob)
+		if encodePlan.codec == "libx265":
+			threadOpt = "-x265-params pools=" + str(coresPerJob)
+		else:
+			threadOpt = "-threads " + str(coresPerJob)
+	
+	### Keep concurrent ffmpeg instances from flooding the console
+	
+	if jobs > 1:
+		verbosityOpt = "-nostats -v error"
+	else:
+		verbosityOpt = "-v verbose"
 		
-		### Encode
+	### Construct, echo, and exec ffmpeg cmd
 		
+	sC = " "
+	
+	encodeArgs = ['ffmpeg', '-y'] + (verbosityOpt + sC + inputThreadOpt).split() + ['-i', inputAbsPath] + (encodePlan.vidMap + sC + encodePlan.audioMap + sC + encodePlan.subMap + sC + encodePlan.audioTag + sC + encodePlan.subTag + sC + encodePlan.scaleOpt + sC + '-c:v' + sC + encodePlan.codec + sC + '-preset' + sC + encodePlan.preset + sC + '-crf' + sC + encodePlan.crf + sC + threadOpt + sC + encodePlan.audioOpt + sC + encodePlan.subOpt + sC + '-disposition:v:0 1 -disposition:a:0 1 -disposition:s:0 0 -map_metadata -1').split() + [finalDest]
+	logger.newline()
+	logger.info("!! exec: %s" % format_cmd(encodeArgs, reportEnv))
+	logger.newline()
+	
+	### Split long inputs into segments that are video encoded in parallel, then joined and muxed
+	
+	segmentArgs = []
+	segmentDir = ""
+	muxArgs = []
+	
+	if segmentEncode and inputDuration >= segmentMinDuration:
+		segments = split_segments(probe.chapters, inputDuration)
+		if len(segments) > 1:
+			segmentDir = finalDest + ".vidChew3-segments"
+			for segNum, (segStart, segEnd) in enumerate(segments):
+				segFile = os.path.join(segmentDir, "seg%04d.mkv" % segNum)
+				if segNum < len(segments) - 1:
+					segLengthOpt = "-t %.3f" % (segEnd - segStart)
+				else:
+					segLengthOpt = ""
+				segmentArgs.append(['ffmpeg', '-y'] + (verbosityOpt + sC + inputThreadOpt + sC + "-ss %.3f" % segStart + sC + segLengthOpt).split() + ['-i', inputAbsPath] + (encodePlan.vidMap + sC + encodePlan.scaleOpt + sC + '-c:v' + sC + encodePlan.codec + sC + '-preset' + sC + encodePlan.preset + sC + '-crf' + sC + encodePlan.crf + sC + threadOpt + sC + '-an -sn -map_metadata -1 -map_chapters -1').split() + [segFile])
+			muxAudioMap = ""
+			muxSubMap = ""
+			if audio is not None: muxAudioMap = "-map 1:" + str(audio.index)
+			if subtitle is not None: muxSubMap = "-map 1:" + str(subtitle.index)
+			muxArgs = ['ffmpeg', '-y'] + (verbosityOpt + sC + '-f concat -safe 0').split() + ['-i', os.path.join(segmentDir, "segments.txt"), '-i', inputAbsPath] + ('-map 0:v:0' + sC + muxAudioMap + sC + muxSubMap + sC + encodePlan.audioTag + sC + encodePlan.subTag + sC + '-c:v copy' + sC + encodePlan.audioOpt + sC + encodePlan.subOpt + sC + '-disposition:v:0 1 -disposition:a:0 1 -disposition:s:0 0 -map_metadata -1 -map_chapters 1').split() + [finalDest]
+			logger.info("++ Segmented encode: %s segments (%s)" % (len(segments), "chapters" if probe.chapters else "every %s sec" % segmentLength))
+			for segArgs in segmentArgs:
+				logger.info("!! exec: %s" % format_cmd(segArgs))
+			logger.info("!! exec: %s" % format_cmd(muxArgs, reportEnv))
+			logger.newline()
+	
+	### Stream pipeline: audio & subtitles are extracted by their own ffmpegs into a cache named after their
+	### settings, the video is encoded alone (keeping the input's chapters) or in segments, then all are muxed
+	
+	videoArgs = []
+	streamArgs = []
+	streamDir = ""
+	
+	if streamPipeline:
+		streamDir = finalDest + ".vidChew3-streams"
+		streamStamp = sC.join([inputAbsPath, str(inputStat.st_size), str(inputStat.st_mtime_ns)])
+		muxInputs = []
+		muxMaps = "-map 0:v:0"
+		if audio is not None:
+			audioFile = os.path.join(streamDir, "audio-%s.mka" % hashlib.sha1(sC.join([streamStamp, encodePlan.audioMap, encodePlan.audioOpt]).encode('utf-8')).hexdigest()[:12])
+			streamArgs.append([audioFile, ['ffmpeg', '-y'] + "-nostats -v error".split() + ['-i', inputAbsPath] + (encodePlan.audioMap + sC + encodePlan.audioOpt + sC + '-vn -sn -map_metadata -1 -map_chapters -1 -f matroska').split() + [audioFile + ".part"]])
+			muxInputs += ['-i', audioFile]
+			muxMaps += sC + "-map %s:a:0" % (len(muxInputs) // 2)
+		if subtitle is not None:
+			subFile = os.path.join(streamDir, "subtitle-%s.mks" % hashlib.sha1(sC.join([streamStamp, encodePlan.subMap, encodePlan.subOpt]).encode('utf-8')).hexdigest()[:12])
+			streamArgs.append([subFile, ['ffmpeg', '-y'] + "-nostats -v error".split() + ['-i', inputAbsPath] + (encodePlan.subMap + sC + encodePlan.subOpt + sC + '-vn -an -map_metadata -1 -map_chapters -1 -f matroska').split() + [subFile + ".part"]])
+			muxInputs += ['-i', subFile]
+			muxMaps += sC + "-map %s:s:0" % (len(muxInputs) // 2)
+		
+		if segmentArgs:
+			videoInput = "-f concat -safe 0".split() + ['-i', os.path.join(segmentDir, "segments.txt")]
+			muxInputs += ['-i', inputAbsPath]
+			chapterMap = "-map_chapters %s" % (len(muxInputs) // 2)
+		else:
+			videoFile = os.path.join(streamDir, "video.mkv")
+			videoArgs = ['ffmpeg', '-y'] + (verbosityOpt + sC + inputThreadOpt).split() + ['-i', inputAbsPath] + (encodePlan.vidMap + sC + encodePlan.scaleOpt + sC + '-c:v' + sC + encodePlan.codec + sC + '-preset' + sC + encodePlan.preset + sC + '-crf' + sC + encodePlan.crf + sC + threadOpt + sC + '-an -sn -map_metadata -1').split() + [videoFile]
+			videoInput = ['-i', videoFile]
+			chapterMap = "-map_chapters 0"
+		muxArgs = ['ffmpeg', '-y'] + verbosityOpt.split() + videoInput + muxInputs + (muxMaps + sC + encodePlan.audioTag + sC + encodePlan.subTag + sC + '-c copy -disposition:v:0 1 -disposition:a:0 1 -disposition:s:0 0 -map_metadata -1' + sC + chapterMap).split() + [finalDest]
+		
+		logger.info("++ Stream pipeline: video%s + %s audio/subtitle streams" % (" (%s segments)" % len(segmentArgs) if segmentArgs else "", len(streamArgs)))
+		for args in [videoArgs] + [args for streamFile, args in streamArgs]:
+			if args: logger.info("!! exec: %s" % format_cmd(args))
+		logger.info("!! exec: %s" % format_cmd(muxArgs))
 		logger.newline()
-		logger.info("-+- Encode -+-")
+	
+	### Sample pieces spread evenly through the input, with the same maps & options as the real encode
+	### (video only for CRF tuning, whose value is filled in per search step)
+	
+	sampleArgs = []
+	tuneArgs = []
+	sampleDir = ""
+	
+	if (sampleEncode or targetBitRate is not None) and sampleCount > 0 and inputDuration >= sampleCount * sampleLength * 2:
+		sampleDir = finalDest + ".vidChew3-samples"
+		for sampleNum in range(sampleCount):
+			sampleStart = inputDuration * (sampleNum + 1) / (sampleCount + 1) - sampleLength / 2
+			sampleFile = os.path.join(sampleDir, "sample%02d.mkv" % sampleNum)
+			sampleInput = ['ffmpeg', '-y'] + ("-nostats -v error" + sC + inputThreadOpt + sC + "-ss %.3f -t %s" % (sampleStart, sampleLength)).split() + ['-i', inputAbsPath]
+			if sampleEncode: sampleArgs.append(sampleInput + (encodePlan.vidMap + sC + encodePlan.audioMap + sC + encodePlan.subMap + sC + encodePlan.audioTag + sC + encodePlan.subTag + sC + encodePlan.scaleOpt + sC + '-c:v' + sC + encodePlan.codec + sC + '-preset' + sC + encodePlan.preset + sC + '-crf' + sC + encodePlan.crf + sC + threadOpt + sC + encodePlan.audioOpt + sC + encodePlan.subOpt + sC + '-map_metadata -1 -map_chapters -1').split() + [sampleFile])
+			if targetBitRate is not None: tuneArgs.append(sampleInput + (encodePlan.vidMap + sC + encodePlan.scaleOpt + sC + '-c:v' + sC + encodePlan.codec + sC + '-preset' + sC + encodePlan.preset + sC + '-crf' + sC + encodePlan.crf + sC + threadOpt + sC + '-an -sn -map_metadata -1 -map_chapters -1').split() + [sampleFile])
+		for args in tuneArgs[:1] + sampleArgs:
+			logger.info("!! exec: %s" % format_cmd(args))
+		if sampleEncode: logger.info("++ Sample encode: %s x %s sec" % (sampleCount, sampleLength))
+		if targetBitRate is not None: logger.info("++ Auto CRF samples: %s x %s sec" % (sampleCount, sampleLength))
 		logger.newline()
-		logger.info("!! Destination: %s" % (finalDest))
+	
+	### Skip inputs a previous run already finished with the same plan
+	
+	if targetBitRate is not None:
+		hashCrf = "auto:%s" % targetBitRate
+	else:
+		hashCrf = encodePlan.crf
+	
+	planHash = hashlib.sha1(sC.join([inputAbsPath, str(inputStat.st_size), str(inputStat.st_mtime_ns), encodePlan.vidMap, encodePlan.audioMap, encodePlan.subMap, encodePlan.audioTag, encodePlan.subTag, encodePlan.scaleOpt, encodePlan.codec, encodePlan.preset, hashCrf, encodePlan.audioOpt, encodePlan.subOpt, finalDest]).encode('utf-8')).hexdigest()
+	
+	if journal:
+		if journal_is_done(inputAbsPath, finalDest, planHash):
+			logger.info("!! Already encoded by a previous run (journal), skipping...")
+			logger.newline()
+			return
+		if journal_is_skipped(inputAbsPath, planHash):
+			logger.info("!! Predicted savings were too low in a previous run (journal), skipping...")
+			logger.newline()
+			return
+		if not dryRun and runMode != "coordinator": journal_set(inputAbsPath, finalDest, planHash, "pending")
+	
+	### Devices the job reads from & writes to, for jobsPerDevice
+	
+	devices = {inputStat.st_dev}
+	try:
+		devices.add(os.stat(os.path.dirname(os.path.abspath(finalDest))).st_dev)
+	except OSError:
+		pass
+	
+	return {"log": logger, "devices": sorted(devices), "encodeArgs": encodeArgs, "reportEnv": reportEnv, "finalDest": finalDest, "reportDest": reportDest, "inputFile": inputFile, "inputSize": inputSize, "inputBytes": inputStat.st_size, "inputDuration": inputDuration, "sourceRes": "%sx%s" % (video.width, video.height), "targetRes": "%sx%s" % (encodePlan.targVidWidth, encodePlan.targVidHeight), "sourceCodec": video.codecName, "videoCodec": encodePlan.codec, "preset": encodePlan.preset, "crf": encodePlan.crf, "inputAbsPath": inputAbsPath, "planHash": planHash, "segmentArgs": segmentArgs, "segmentDir": segmentDir, "muxArgs": muxArgs, "videoArgs": videoArgs, "streamArgs": streamArgs, "streamDir": streamDir, "sampleArgs": sampleArgs, "sampleDir": sampleDir, "tuneArgs": tuneArgs, "targetBitRate": targetBitRate}
+
+### Encode a prepared job
+
+def encode_job(job):
+	
+	logger = job["log"]
+	finalDest = job["finalDest"]
+	reportDest = job["reportDest"]
+	inputSize = job["inputSize"]
+	inputAbsPath = job["inputAbsPath"]
+	planHash = job["planHash"]
+	sC = " "
+	
+	if not dryRun:
 		
-		### Enable ffmpeg logging, if requested
+		ffmpegFailed = False
+		encodeStart = encodeGovernor.clock()
+		scratchDest = ""
+		if scratchDir != "": scratchDest = stage_to_scratch(job)
+		use_staged_input(job)
 		
-		if ffmpegLogs:
-			destAbsPath = os.path.abspath(finalDest)
-			finalPath, finalFile = os.path.split(destAbsPath)
-			reportFilename = finalFile + "-report.log"
-			reportDest = inputPath + "/" + reportFilename
-			logger.info("++ ffmpeg log: %s" % reportFilename)
-			reportOpt = "FFREPORT=file=\"" + reportDest + "\":level=40"
+		### Tune CRF first, so the savings samples and the encode use it
+		
+		if autoCrf and job.get("targetBitRate"):
+			tunedCrf = tune_crf(job)
+			if tunedCrf is None:
+				logger.info("!! Auto CRF unavailable, using crf %s" % job["crf"])
+			else:
+				job["crf"] = tunedCrf
+				job["encodeArgs"] = with_crf(job["encodeArgs"], tunedCrf)
+				if job.get("videoArgs"): job["videoArgs"] = with_crf(job["videoArgs"], tunedCrf)
+				job["segmentArgs"] = [with_crf(args, tunedCrf) for args in job["segmentArgs"]]
+				job["sampleArgs"] = [with_crf(args, tunedCrf) for args in job["sampleArgs"]]
+		
+		### Sample encode first, inputs that won't save at least sampleMinSavings are skipped or flagged
+		
+		if job.get("sampleArgs"):
+			job["predictedSavings"] = sample_encode(job)
+			log_event("sample", inputAbsPath, predictedSavings=job["predictedSavings"])
+			if job["predictedSavings"] is None:
+				logger.info("!! Sample encode failed, encoding anyway...")
+			else:
+				logger.info("++ Predicted savings: %s%% (%s samples in %s sec)" % (job["predictedSavings"], len(job["sampleArgs"]), round(encodeGovernor.clock() - encodeStart, 1)))
+				if job["predictedSavings"] < sampleMinSavings:
+					if sampleAction == "skip":
+						logger.info("!! Predicted savings below sampleMinSavings (%s%%), skipping..." % sampleMinSavings)
+						if journal: journal_set(inputAbsPath, finalDest, planHash, "skipped", savings=job["predictedSavings"])
+						write_metrics(job, "skipped", encodeGovernor.clock() - encodeStart, 0)
+						return
+					logger.info("!! Predicted savings below sampleMinSavings (%s%%), encoding anyway (flagged)" % sampleMinSavings)
+		
+		if journal: journal_set(inputAbsPath, finalDest, planHash, "running")
+		log_event("start", inputAbsPath, crf=job["crf"], segments=len(job["segmentArgs"]))
+		job["progress"] = {}
+		with progressLock:
+			runningJobs[inputAbsPath] = job
+		try:
+			if job.get("streamArgs") or job.get("videoArgs"):
+				ffReturnCode = encode_streams(job)
+			elif job["segmentArgs"]:
+				ffReturnCode = encode_segments(job)
+			else:
+				ffReturnCode = run_ffmpeg(job, job["encodeArgs"], job["reportEnv"], "encode")
+		finally:
+			with progressLock:
+				del runningJobs[inputAbsPath]
+		logger.newline()
+		
+		### ffmpeg error handling
+		
+		if ffReturnCode != 0:
+			logger.info("!! ffmpeg exited prematurely and your encode is probably toast ;[")
+			if ffmpegLogs and os.path.isfile(reportDest + reportSuffix): os.replace(reportDest + reportSuffix, reportDest + ".ERROR" + reportSuffix)
+			ffmpegFailed = True
+			job["failed"] = True
+			if scratchDest != "" and os.path.isfile(scratchDest): os.remove(scratchDest)
+			if journal: journal_set(inputAbsPath, finalDest, planHash, "failed")
+			write_metrics(job, "failed", encodeGovernor.clock() - encodeStart, 0)
+			if exitOnFail:
+				logger.info("!! Exit on fail is enabled, exiting...")
+				stopEvent.set()
 		else:
-			reportOpt = ""
-			
-		### Construct, echo, and exec ffmpeg cmd
-			
-		sC = " "
+			logger.info("!! ffmpeg exited normally! ;]")
 		
-		encodeCmd = reportOpt + sC + '</dev/null' + sC + 'ffmpeg -y -v verbose -i' + sC + '"' + inputAbsPath + '"' + sC + targVidTrackMap + sC + targAudioTrackMap + sC + targSubTrackMap + sC + targAudioTrackTag + sC + targSubTrackTag + sC + scaleOpt + sC + '-c:v' + sC + videoTargCodec + sC + '-preset' + sC + videoTargCodecPreset + sC + '-crf' + sC + videoTargCrf + sC + audioOpt + sC + subOpt + sC + '-disposition:v:0 1 -disposition:a:0 1 -disposition:s:0 0 -map_metadata -1' + sC + '"' + finalDest + '"'
+		### Hand scratch outputs to the offload stage, which finishes the job once the output is in place
+		
+		if not ffmpegFailed:
+			if scratchDest != "":
+				job["offload"] = offloadPool.submit(offload_output, job, scratchDest, encodeGovernor.clock() - encodeStart)
+			else:
+				finish_job(job, encodeGovernor.clock() - encodeStart)
+
+### Record a finished encode in the journal & metrics, and log its size & savings
+
+def finish_job(job, encodeTime):
+	
+	logger = job["log"]
+	inputSize = job["inputSize"]
+	
+	### Ontain output filesize, convert to MB
+	
+	outputSize = os.stat(job["finalDest"])
+	if journal: journal_set(job["inputAbsPath"], job["finalDest"], job["planHash"], "done", outputSize.st_size)
+	write_metrics(job, "done", encodeTime, outputSize.st_size)
+	outputSize = int(outputSize.st_size) / 1000000
+	outputSize = str(round(outputSize, 2))
+	
+	### Compare input/output sizes
+	
+	logger.newline()
+	logger.info(":: Encode Complete")
+	logger.info("\t Input size: %s MB" % inputSize)
+	logger.info("\t Output size: %s MB" % outputSize)
+	
+	if float(outputSize) > 0:
+		finalSavings = 100 - (float(outputSize) / float(inputSize) * 100)
+		finalSavings = str(round(finalSavings, 2))
+		finalSavings = finalSavings + "%"
+		logger.info("\t Savings: %s" % (finalSavings))
+	else:
+		logger.info("\t Can't calculate savings!  Something probably went wrong with the encode.")
+
+### Input staging: copy a job's input to scratchDir or pre-read it with posix_fadvise.  Returns the staged
+### copy's path, or None.
+
+def stage_input(job):
+	
+	if inputStaging == "fadvise":
+		inputFd = os.open(job["inputAbsPath"], os.O_RDONLY)
+		try:
+			os.posix_fadvise(inputFd, 0, 0, os.POSIX_FADV_WILLNEED)
+		finally:
+			os.close(inputFd)
+		return None
+	
+	stagedPath = os.path.join(scratchDir, "vidChew3-input-" + job["planHash"][:12] + os.path.splitext(job["inputAbsPath"])[1])
+	try:
+		shutil.copyfile(job["inputAbsPath"], stagedPath)
+	except OSError as stagingExc:
+		with logLock:
+			logger.info("!! Staging %s failed: %s" % (job["inputFile"], repr(stagingExc)))
+		if os.path.isfile(stagedPath): os.remove(stagedPath)
+		return None
+	return stagedPath
+
+### Staging thread: stages the next jobs (one per encoder) one at a time in the order the scheduler will hand
+### them out, within stagingBudget for copies & pre-reads alike (larger inputs are read in place).  A job's "staging" is claimed under stagingCond,
+### either here (a future) or by an encoder that got to it first (None, read in place), so an encoder never
+### waits on staging that hasn't started.
+
+def staging_worker():
+	
+	while not stopEvent.is_set():
+		with stagingCond:
+			upcoming = [job for job in readyJobs.upcoming()[:jobs] if "staging" not in job]
+			if not upcoming:
+				if readyJobs.closed and not readyJobs.jobs: return
+				stagingCond.wait(1)
+				continue
+			job = upcoming[0]
+			if job["inputBytes"] > stagingBudget * 1000000000:
+				job["staging"] = None
+				continue
+			if stagingTotals["bytes"] + job["inputBytes"] > stagingBudget * 1000000000:
+				stagingCond.wait(1)
+				continue
+			stagingTotals["bytes"] += job["inputBytes"]
+			staging = job["staging"] = concurrent.futures.Future()
+		staging.set_result(stage_input(job))
+
+### Point a job's ffmpeg inputs at its staged copy, waiting for the copy to finish if it's still running
+
+def use_staged_input(job):
+	
+	with stagingCond:
+		staging = job.setdefault("staging", None)
+	if staging is None: return
+	waitStart = time.time()
+	stagedPath = staging.result()
+	if stagedPath is None: return
+	
+	def swap_input(args):
+		return [stagedPath if arg == job["inputAbsPath"] else arg for arg in args]
+	
+	job["encodeArgs"] = swap_input(job["encodeArgs"])
+	job["muxArgs"] = swap_input(job["muxArgs"])
+	job["videoArgs"] = swap_input(job.get("videoArgs", []))
+	job["streamArgs"] = [[streamFile, swap_input(args)] for streamFile, args in job.get("streamArgs", [])]
+	for key in ("segmentArgs", "sampleArgs", "tuneArgs"):
+		job[key] = [swap_input(args) for args in job.get(key, [])]
+	job["log"].info("++ Reading staged input: %s (waited %s sec)" % (stagedPath, round(time.time() - waitStart, 1)))
+
+### Delete a job's staged copy once it's no longer needed and give its bytes back to the budget
+
+def release_staged_input(job):
+	
+	with stagingCond:
+		staging = job.pop("staging", None)
+	if staging is None: return
+	stagedPath = staging.result()
+	if stagedPath is not None and os.path.isfile(stagedPath): os.remove(stagedPath)
+	with stagingCond:
+		stagingTotals["bytes"] -= job["inputBytes"]
+		stagingCond.notify_all()
+
+### Point a job's ffmpeg outputs (encode/mux output, pipeline video, segments & samples) at scratchDir, returns the
+### scratch output.  The audio/subtitle stream cache stays next to the destination, so it outlives scratch.
+
+def stage_to_scratch(job):
+	
+	def move_paths(args, oldDir, newDir):
+		return [newDir + arg[len(oldDir):] if arg.startswith(oldDir) else arg for arg in args]
+	
+	scratchDest = os.path.join(scratchDir, job["planHash"][:12] + "-" + os.path.basename(job["finalDest"]))
+	job["encodeArgs"] = job["encodeArgs"][:-1] + [scratchDest]
+	if job["muxArgs"]: job["muxArgs"] = job["muxArgs"][:-1] + [scratchDest]
+	
+	if job.get("videoArgs"):
+		videoFile = scratchDest + ".vidChew3-video.mkv"
+		job["muxArgs"] = [videoFile if arg == job["videoArgs"][-1] else arg for arg in job["muxArgs"]]
+		job["videoArgs"] = job["videoArgs"][:-1] + [videoFile]
+	
+	if job["segmentDir"]:
+		segmentDir = scratchDest + ".vidChew3-segments"
+		job["segmentArgs"] = [move_paths(args, job["segmentDir"], segmentDir) for args in job["segmentArgs"]]
+		job["muxArgs"] = move_paths(job["muxArgs"], job["segmentDir"], segmentDir)
+		job["segmentDir"] = segmentDir
+	
+	if job.get("sampleDir"):
+		sampleDir = scratchDest + ".vidChew3-samples"
+		job["sampleArgs"] = [move_paths(args, job["sampleDir"], sampleDir) for args in job["sampleArgs"]]
+		job["tuneArgs"] = [move_paths(args, job["sampleDir"], sampleDir) for args in job["tuneArgs"]]
+		job["sampleDir"] = sampleDir
+	
+	return scratchDest
+
+### Offload stage: fsync a finished scratch output and move it to its destination while the next encode runs.
+### Across filesystems it's copied to a .vidChew3-part file first and renamed, so it only appears once whole.
+
+def offload_output(job, scratchDest, encodeTime):
+	
+	logger = job["log"]
+	finalDest = job["finalDest"]
+	offloadStart = time.time()
+	
+	try:
+		with open(scratchDest, "rb") as scratchFile:
+			os.fsync(scratchFile.fileno())
+		try:
+			os.rename(scratchDest, finalDest)
+		except OSError as renameExc:
+			if renameExc.errno != errno.EXDEV: raise
+			partDest = finalDest + ".vidChew3-part"
+			shutil.copyfile(scratchDest, partDest)
+			with open(partDest, "rb") as partFile:
+				os.fsync(partFile.fileno())
+			os.replace(partDest, finalDest)
+			os.remove(scratchDest)
+		logger.info("++ Moved to destination in %s sec" % round(time.time() - offloadStart, 1))
+		finish_job(job, encodeTime)
+	except Exception as offloadExc:
+		logger.info("!! Moving to destination failed: %s (output kept at %s)" % (repr(offloadExc), scratchDest))
+		job["failed"] = True
+		if journal: journal_set(job["inputAbsPath"], finalDest, job["planHash"], "failed")
+		write_metrics(job, "failed", encodeTime, 0)
+	finally:
+		logger.flush()
+
+##### Functions End #####
+
+### Run only when started as a script, so the functions above can be imported (e.g. by the tests)
+
+if __name__ == "__main__":
+	
+	### Options set in vidChew3conf.py override the Default Config, so older config files keep working
+
+	configPath = runFrom + "/" + "vidChew3conf.py"
+	usingConfig = os.path.isfile(configPath)
+
+	if usingConfig:
+		from vidChew3conf import *
+
+	### Check for an argument
+
+	if len(sys.argv) > 1:
+		print("!! This script doesn't accept any arguments!")
+		print("!! It's intended to run recursively on the current directory")
+		quit()
+	else:
+		specifiedInputFolder = "."
+	
+	### Check to see if destDir exists
+
+	if destDir != "":
+		if os.path.isdir(destDir) == False:
+			print("!! destDir (%s) does not exist!" % destDir)
+			quit()
+	
+	### Check to see if scratchDir exists
+
+	if scratchDir != "":
+		scratchDir = os.path.abspath(scratchDir)
+		if os.path.isdir(scratchDir) == False:
+			print("!! scratchDir (%s) does not exist!" % scratchDir)
+			quit()
+	
+	### Create logger for status output / log writing
+
+	if eventsFile != "":
+		eventsPath = os.path.join(os.path.abspath(specifiedInputFolder), eventsFile)
+	else:
+		eventsPath = ""
+
+	if doLogFile:
+		logFolder = os.path.abspath(specifiedInputFolder)
+		logger = create_logger(1, logFolder, eventsPath)
+	else:
+		logger = create_logger(0, "", eventsPath)
+	
+	### Say hello!
+
+	inputFolder = os.path.abspath(specifiedInputFolder)
+	
+	logger.newline()
+	logger.info("!! vidChew3 by \m/rr :: %s" % ver)
+	logger.info("!! startTime: %s" % str(startTime))
+	logger.info("!! inputFolder: %s" % inputFolder)
+	if usingConfig: logger.info("++ Using config: %s" % configPath)
+	if not usingConfig: logger.info("-- Using internal config")
+	if dryRun: logger.info("-- Dry run enabled!")
+	if debug: logger.info("** Debugging output enabled!")
+
+	if audioReenc and audioDownmix:
 		logger.newline()
-		logger.info("!! exec: %s" % encodeCmd)
+		logger.info("!! Audio reencoding and downmixing cannot both be enabled!")
 		logger.newline()
-		
-		if not dryRun:
-			
-			ffmpegFailed = False
-			
-			ffReturnCode = os.system(encodeCmd)
-			logger.newline()
-			
-			### ffmpeg error handling
-			
-			if ffReturnCode != 0:
-				logger.info("!! ffmpeg exited prematurely and your encode is probably toast ;[")
-				if ffmpegLogs: os.system("mv" + sC + reportDest + sC + reportDest + ".ERROR")
-				if ffmpegLogs: os.system("gzip -f" + sC + reportDest + ".ERROR")
-				ffmpegFailed = True
-				if exitOnFail:
-					logger.info("!! Exit on fail is enabled, exiting...")
-					quit()
+		quit()
+	
+	### Open the state database (probe cache, run journal & tuned CRFs)
+
+	dbLock = threading.Lock()
+
+	### In worker mode, the queue directory tracks job state instead of the local journal
+
+	if runMode == "worker":
+		journal = False
+
+	### Plan mode never encodes
+
+	if runMode == "plan":
+		dryRun = True
+
+	if probeCache or journal or autoCrf:
+		stateDbPath = os.path.join(inputFolder, stateDbFile)
+		stateDb = open_state_db(stateDbPath)
+		logger.info("++ State database: %s" % stateDbPath)
+	else:
+		stateDb = None
+
+	if journal and not dryRun:
+		journal_recover()
+	if scratchDir != "" and not dryRun and runMode in ("encode", "watch"):
+		staging_recover()
+
+	### Set up the shared job queue for coordinator/worker mode
+
+	if runMode not in ("encode", "coordinator", "worker", "bench", "plan", "watch"):
+		logger.info("!! Unknown runMode: %s" % runMode)
+		quit()
+
+	### ffmpeg logs are compressed as they're written
+
+	if reportCompression not in ("gzip", "zstd") or (reportCompression == "zstd" and zstd is None):
+		logger.info("-- %s compression unavailable, ffmpeg logs will be gzipped" % reportCompression)
+		reportCompression = "gzip"
+	reportSuffix = ".zst" if reportCompression == "zstd" else ".gz"
+
+	if sampleEncode and sampleAction not in ("skip", "flag"):
+		logger.info("!! Unknown sampleAction: %s" % sampleAction)
+		quit()
+
+	if runMode in ("coordinator", "worker"):
+		queueDir = os.path.abspath(queueDir)
+		if not os.path.isdir(queueDir):
+			logger.info("!! queueDir (%s) does not exist!" % queueDir)
+			quit()
+		for state in ("pending", "running", "done", "failed"):
+			os.makedirs(os.path.join(queueDir, state), exist_ok=True)
+		if runMode == "coordinator":
+			if os.path.isfile(os.path.join(queueDir, "complete")):
+				os.remove(os.path.join(queueDir, "complete"))
+			queuedIds = set()
+			queuedLock = threading.Lock()
+			for state in ("pending", "running", "done"):
+				for queuedFile in os.listdir(os.path.join(queueDir, state)):
+					queuedIds.add(queuedFile.split("@")[0].split(".")[0])
+		if runMode == "worker" and dryRun:
+			logger.info("-- Dry run, %s jobs pending in queue" % len(os.listdir(os.path.join(queueDir, "pending"))))
+			quit()
+		logger.info("++ runMode: %s | queueDir: %s" % (runMode, queueDir))
+
+	### Determine worker pool size
+
+	cpuCount = os.cpu_count() or 1
+
+	if jobs < 1:
+		if coresPerJob > 0:
+			jobs = max(1, cpuCount // coresPerJob)
+		else:
+			jobs = 1
+
+	logger.info("++ jobs: %s | coresPerJob: %s | cpuCount: %s | probeJobs: %s | prefetchDepth: %s" % (jobs, coresPerJob if coresPerJob > 0 else "auto", cpuCount, probeJobs, prefetchDepth))
+
+	logLock = threading.Lock()
+	stopEvent = threading.Event()
+	progressLock = threading.Lock()
+	progressStop = threading.Event()
+	runningJobs = {}
+	progressTotals = {"queuedDuration": 0.0, "queuedCount": 0}
+	plannedJobs = []
+	walkTotals = {"folders": 0, "files": 0, "filtered": 0}
+	metricsLock = threading.Lock()
+	crfLocksLock = threading.Lock()
+	crfLocks = {}
+	runTotals = {"encoded": 0, "failed": 0, "skipped": 0, "inputBytes": 0, "outputBytes": 0, "cpuSeconds": 0.0}
+
+	if metricsFile != "":
+		metricsPath = os.path.join(inputFolder, metricsFile)
+		logger.info("++ Metrics: %s" % metricsPath)
+	probeSlots = threading.BoundedSemaphore(max(1, probeJobs) * 2)
+	readyJobs = JobScheduler(max(0, prefetchDepth))
+
+	### Scheduling estimates come from past encodes in metricsFile when there are any
+
+	if schedulePolicy not in ("fifo", "savings", "lpt"):
+		logger.info("!! Unknown schedulePolicy: %s" % schedulePolicy)
+		quit()
+	scheduleHistory = load_history() if schedulePolicy != "fifo" else {}
+
+	### Outputs staged in scratchDir are moved to their destination by the offload stage
+
+	offloadPool = None
+	if scratchDir != "":
+		offloadPool = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, offloadJobs), thread_name_prefix="offload")
+		logger.info("++ Scratch: %s (%s offload jobs)" % (scratchDir, max(1, offloadJobs)))
+
+	### Upcoming inputs are staged (copied to scratchDir or pre-read) by a single thread, in scheduler order
+
+	stagingCond = threading.Condition()
+	stagingTotals = {"bytes": 0}
+	if inputStaging not in ("", "copy", "fadvise"):
+		logger.info("!! Unknown inputStaging: %s" % inputStaging)
+		quit()
+	elif inputStaging == "copy" and scratchDir == "":
+		logger.info("-- inputStaging \"copy\" needs a scratchDir, inputs will be read in place")
+	elif inputStaging != "" and not dryRun and runMode in ("encode", "watch"):
+		stagingThread = threading.Thread(target=staging_worker, name="staging", daemon=True)
+		stagingThread.start()
+		logger.info("++ Input staging: %s" % inputStaging)
+
+	### Encoders run at encodeNice & encodeIoClass, through nice/ionice so the (same) ffmpeg pid is still ours to reap
+
+	launchPrefix = []
+	if encodeNice != 0:
+		launchPrefix += ["nice", "-n", str(encodeNice)]
+	if encodeIoClass not in ("", "best-effort", "idle"):
+		logger.info("!! Unknown encodeIoClass: %s" % encodeIoClass)
+		quit()
+	elif encodeIoClass != "" and shutil.which("ionice") is None:
+		logger.info("-- ionice not found, encodeIoClass is ignored")
+	elif encodeIoClass == "best-effort":
+		launchPrefix += ["ionice", "-c", "2", "-n", str(encodeIoLevel)]
+	elif encodeIoClass == "idle":
+		launchPrefix += ["ionice", "-c", "3"]
+
+	### The governor holds encodes outside encodeWindows and adjusts encode slots to resource pressure while
+	### encoding (it never limits a run otherwise)
+
+	try:
+		encodeWindowList = [parse_window(window) for window in encodeWindows]
+	except ValueError:
+		logger.info("!! Invalid encodeWindows: %s" % encodeWindows)
+		quit()
+
+	encodeGovernor = EncodeGovernor(jobs)
+	if (resourceGovernor or encodeWindowList) and runMode in ("encode", "watch", "worker") and not dryRun:
+		if encodeWindowList:
+			logger.info("++ Encode windows: %s" % ", ".join(encodeWindows))
+			encodeGovernor.check_window()
+		if resourceGovernor:
+			logger.info("++ Resource governor: load/cpu %s | mem available %s%% | pressure %s%%" % (governorMaxLoad, governorMinMemory, governorMaxPressure))
+		governorThread = threading.Thread(target=encodeGovernor.run, name="governor", daemon=True)
+		governorThread.start()
+		atexit.register(encodeGovernor.shutdown)
+		signal.signal(signal.SIGINT, resume_on_signal)
+		signal.signal(signal.SIGTERM, resume_on_signal)
+
+	### Report live progress of running encodes
+
+	if progressInterval > 0 and not dryRun:
+		progressThread = threading.Thread(target=progress_reporter, name="progress", daemon=True)
+		progressThread.start()
+
+	### Bench mode, no input walk, just synthetic clips
+
+	if runMode == "bench":
+	
+		run_bench()
+
+	### Worker mode, encode jobs from the shared queue instead of walking the input folder
+
+	elif runMode == "worker":
+	
+		workerId = socket.gethostname() + "-" + str(os.getpid())
+		claimedPaths = set()
+		claimedLock = threading.Lock()
+		heartbeatStop = threading.Event()
+		logger.info("++ Queue worker %s on %s" % (workerId, queueDir))
+	
+		heartbeatThread = threading.Thread(target=queue_heartbeat, name="heartbeat", daemon=True)
+		heartbeatThread.start()
+	
+		encodeThreads = []
+		for i in range(jobs):
+			encodeThread = threading.Thread(target=queue_worker, name="encode-%s" % i)
+			encodeThread.start()
+			encodeThreads.append(encodeThread)
+		for encodeThread in encodeThreads:
+			encodeThread.join()
+		heartbeatStop.set()
+
+	else:
+	
+		### Start encoders, they wait on the probe stage for planned jobs (coordinator & plan modes don't encode)
+	
+		encodeThreads = []
+		if runMode in ("encode", "watch"):
+			for i in range(jobs):
+				encodeThread = threading.Thread(target=encode_worker, name="encode-%s" % i)
+				encodeThread.start()
+				encodeThreads.append(encodeThread)
+	
+		### Walk input folder and probe ahead of the encoders
+	
+		with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, probeJobs)) as probePool:
+			if runMode == "watch":
+				watch_inputs(probePool)
 			else:
-				logger.info("!! ffmpeg exited normally! ;]")
-			
-			### Ontain output filesize, convert to MB
-			
-			if not ffmpegFailed:
-				if ffmpegLogs: os.system("gzip -f" + sC + reportDest)
-				outputSize = os.stat(finalDest)
-				outputSize = int(outputSize.st_size) / 1000000
-				outputSize = str(round(outputSize, 2))
-			
-			### Compare input/output sizes
-			
+				for root, filename, inputStat in walk_inputs(inputFolder):
+					if not submit_probe(probePool, root, filename, inputStat): break
+	
+		if runMode != "watch":
+			with logLock:
 				logger.newline()
-				logger.info(":: Encode Complete")
-				logger.info("\t Input size: %s MB" % inputSize)
-				logger.info("\t Output size: %s MB" % outputSize)
-				
-				if float(outputSize) > 0:
-					finalSavings = 100 - (float(outputSize) / float(inputSize) * 100)
-					finalSavings = str(round(finalSavings, 2))
-					finalSavings = finalSavings + "%"
-					logger.info("\t Savings: %s" % (finalSavings))
-				else:
-					logger.info("\t Can't calculate savings!  Something probably went wrong with the encode.")
-				
-os.system("rm -rf __pycache__")
-
-endTime = datetime.datetime.now().strftime("%m/%d/%y %H:%M:%S")
-endTimer = time.time()
-runDuration = endTimer - startTimer
-
-if runDuration > 60:
-	runDuration = runDuration / 60
-	runDuration = str(round(runDuration, 2)) + " min"
-else:
-	runDuration = str(round(runDuration, 2)) + " sec"
-
-logger.newline()
-logger.info("!! startTime: %s" % startTime)
-logger.info("!! endTime: %s" % endTime)
-logger.info("!! duration: %s" % runDuration)
-logger.newline()
-logger.info("!! vidChew3 done! ;D")
-logger.newline()
+				logger.info("++ Walked %s folders: %s files probed, %s skipped by extension/size" % (walkTotals["folders"], walkTotals["files"], walkTotals["filtered"]))
+	
+		readyJobs.close()
+		for encodeThread in encodeThreads:
+			encodeThread.join()
+	
+		### Let workers know no more jobs are coming
+	
+		if runMode == "coordinator":
+			open(os.path.join(queueDir, "complete"), "w").close()
+			logger.newline()
+			logger.info("!! Planning pass complete, jobs are in %s" % queueDir)
+	
+		if runMode == "plan":
+			capacity_report(plannedJobs)
+
+	### Wait for outputs still being moved off scratch
+
+	if offloadPool is not None:
+		offloadPool.shutdown(wait=True)
+
+	progressStop.set()
+	encodeGovernor.shutdown()
+
+	if stopEvent.is_set():
+		quit()
+
+	os.system("rm -rf __pycache__")
+
+	endTime = datetime.datetime.now().strftime("%m/%d/%y %H:%M:%S")
+	endTimer = time.time()
+	runDuration = endTimer - startTimer
+
+	if runDuration > 60:
+		runDuration = runDuration / 60
+		runDuration = str(round(runDuration, 2)) + " min"
+	else:
+		runDuration = str(round(runDuration, 2)) + " sec"
+
+	logger.newline()
+	logger.info("!! startTime: %s" % startTime)
+	logger.info("!! endTime: %s" % endTime)
+	logger.info("!! duration: %s" % runDuration)
+	logger.newline()
+
+	### Run summary
+
+	if runTotals["encoded"] + runTotals["failed"] + runTotals["skipped"] > 0:
+		savedGB = (runTotals["inputBytes"] - runTotals["outputBytes"]) / 1000000000
+		cpuHours = runTotals["cpuSeconds"] / 3600
+		logger.info(":: Run Summary")
+		logger.info("\t Encoded: %s | Failed: %s | Skipped: %s" % (runTotals["encoded"], runTotals["failed"], runTotals["skipped"]))
+		logger.info("\t Saved: %s GB (%s GB -> %s GB)" % (round(savedGB, 2), round(runTotals["inputBytes"] / 1000000000, 2), round(runTotals["outputBytes"] / 1000000000, 2)))
+		logger.info("\t CPU time: %s hours" % round(cpuHours, 3))
+		if cpuHours > 0: logger.info("\t GB saved per CPU-hour: %s" % round(savedGB / cpuHours, 2))
+		logger.newline()
+	logger.info("!! vidChew3 done! ;D")
+	logger.newline()
@@ -8,12 +8,141 @@ debug = False
 doLogFile = True
 ### Generate a log for each ffmpeg invocation
 ffmpegLogs = True
+### Compression for ffmpeg logs, "gzip" or "zstd" (zstd needs Python 3.14+)
+reportCompression = "gzip"
+### Also write log lines & job events (planned/start/done/failed/skipped...) as JSON lines to this file in the input folder ("" = off)
+eventsFile = ""
+
+### Reuse ffprobe results from previous runs for unchanged files
+probeCache = True
+### Journal each job's progress so a restarted run skips finished work and resumes the rest
+journal = True
+### State database (probe cache & journal), kept in the input folder next to the logs
+stateDbFile = "vidChew3-state.db"
+
+### Seconds between live progress/ETA updates for running encodes (0 = off)
+progressInterval = 30
+### Append a metrics record (JSON lines) per encode to this file in the input folder ("" = off)
+metricsFile = "vidChew3-metrics.jsonl"
 
 ### Exit the script if ffmpeg fails
 exitOnFail = False
 
+### Number of simultaneous encodes (0 = cpu count / coresPerJob)
+jobs = 1
+### Threads given to each encode (0 = let ffmpeg/x265 decide)
+coresPerJob = 0
+### Number of files probed at once ahead of the encoders
+probeJobs = 2
+### Number of probed & planned files allowed to wait for an encoder (0 = no limit, the whole library is
+### probed ahead so schedulePolicy sees every job)
+prefetchDepth = 4
+### Order waiting jobs are encoded in: "fifo" (walk order), "savings" (most expected bytes saved per cpu-second first)
+### or "lpt" (longest expected encode first, so the batch finishes as early as possible)
+schedulePolicy = "fifo"
+### Most encodes reading from or writing to the same device (st_dev of input & output folder) at once (0 = no limit)
+jobsPerDevice = 0
+
+### Only start & run encodes inside these windows ("[days] HH:MM-HH:MM", e.g. "Mon-Fri 22:00-07:00", "Sat-Sun 00:00-24:00"),
+### outside them running ffmpegs are suspended and resumed when a window opens ([] = any time)
+encodeWindows = []
+### Raise or lower the number of running encodes (and pause them with SIGSTOP) to leave room for other workloads
+resourceGovernor = False
+### Seconds between governor (and encodeWindows) checks
+governorInterval = 10
+### Encodes are cut back when the 1 min load average left by other processes exceeds governorMaxLoad per cpu,
+### MemAvailable drops below governorMinMemory percent, or memory/io pressure (/proc/pressure "some" avg10)
+### exceeds governorMaxPressure percent
+governorMaxLoad = 0.5
+governorMinMemory = 10
+governorMaxPressure = 20
+### Nice level (0-19) of encoders, and their ionice class ("best-effort", "idle" or "" = unchanged) & best-effort level (0-7)
+encodeNice = 0
+encodeIoClass = ""
+encodeIoLevel = 7
+
+### Split long inputs into segments (on chapters if present) and encode them in parallel
+segmentEncode = False
+### Only segment inputs at least this long (seconds)
+segmentMinDuration = 3600
+### Minimum segment length (seconds), also the split interval for inputs without chapters
+segmentLength = 600
+### Number of segments of one input encoded at once
+segmentJobs = 4
+
+### Encode video, audio & subtitles in separate ffmpegs at once, then mux them.  Audio & subtitles are cached
+### next to the output until the mux succeeds, so a failed video encode is retried alone.
+streamPipeline = False
+
+### Sample encode a few short pieces of each input (with the real settings) and predict its savings first
+sampleEncode = False
+### Number of samples, spread through the input and encoded at once, and their length (seconds)
+sampleCount = 3
+sampleLength = 20
+### Inputs predicted to save less than this (percent) are skipped ("skip") or encoded & flagged in the log ("flag")
+sampleMinSavings = 10
+sampleAction = "skip"
+
+### Tune CRF per input by binary searching on sampled pieces (sampleCount x sampleLength) for a video bitrate target
+autoCrf = False
+### Target video bitrate (kb/s) per resolution class, the first class <= the output height applies
+autoCrfBitRates = {2160: 12000, 1080: 4000, 720: 2200, 0: 1200}
+### Lowest & highest CRF the search may pick (videoTargCrf is used for inputs too short to sample)
+autoCrfRange = [16, 30]
+
+### Run mode
+###   "encode"      - walk the current directory and encode (default)
+###   "coordinator" - walk and plan only, writing jobs to queueDir for workers
+###   "worker"      - encode jobs from queueDir (any host mounting the share at the same path)
+###   "bench"       - encode synthetic clips across the bench* settings below and report throughput
+###   "plan"        - walk and plan only, then predict cpu-hours, wall-clock & output size from metricsFile history
+###   "watch"       - encode the current directory, then keep watching it (inotify, or polling) for new files
+runMode = "encode"
+### Shared queue directory for coordinator/worker mode
+queueDir = ""
+### Seconds between worker heartbeats / queue polls
+queueHeartbeat = 30
+queuePoll = 10
+### Jobs whose worker hasn't heartbeat in this many seconds are put back in the queue
+queueStaleAfter = 300
+
+### Watch mode: new files must keep the same size & mtime for watchSettle seconds before they're encoded
+watchSettle = 60
+### Seconds between rescans when inotify isn't available (or runs out of watches)
+watchPoll = 300
+
+### Bench mode: clips & outputs go in benchDir, results in benchFile (both in the current directory)
+benchDir = "vidChew3-bench"
+benchFile = "vidChew3-bench.jsonl"
+### lavfi sources, sizes, durations (seconds) and frame rate of the synthetic clips
+benchSources = ['testsrc2', 'mandelbrot']
+benchSizes = ['1280x720', '1920x1080', '3840x2160']
+benchDurations = [10, 30]
+benchRate = 24
+### Settings matrix, every combination is encoded (benchThreads sets coresPerJob, benchJobs sets jobs)
+benchPresets = ['fast', 'medium']
+benchCrfs = ['22']
+benchThreads = [0]
+benchJobs = [1, 2]
+
 ### Output directory for encodes
 destDir = ""
+### Write encodes (and segments/samples) to this local scratch folder, then move them to their destination in the background ("" = off)
+scratchDir = ""
+### Number of finished outputs moved to their destination at once
+offloadJobs = 1
+### Stage upcoming inputs while the current encodes run: "copy" them to scratchDir, "fadvise" (pre-read into
+### the page cache with posix_fadvise WILLNEED), or "" (off)
+inputStaging = ""
+### Most GB of inputs staged at once, copied to scratchDir or pre-read (larger inputs are read in place)
+stagingBudget = 50
+
+### Only files with these extensions are probed ([] = probe everything)
+mediaExtensions = ['.mkv', '.mp4', '.m4v', '.avi', '.mov', '.wmv', '.ts', '.m2ts', '.mpg', '.mpeg', '.vob', '.webm', '.flv']
+### Files smaller than this (MB) are never probed
+minInputSize = 1
+### Folder names that are never walked (hidden folders, destDir & queueDir never are either)
+excludeDirs = []
 
 ### fileTag will be appended to the end of output filenames
 fileTag = "-myTag"